@@ -0,0 +1,72 @@
+"""Measure the throughput (lines per second) of the known-error classifier,
+compared with trying every pattern on every line.
+
+Usage: python benchmarks/bench_classifier.py [number_of_lines] [number_of_patterns]
+"""
+import random
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+from azpipeline.classifier import ErrorClassifier
+
+
+def make_patterns(patterns_count: int) -> Dict[str, List[str]]:
+    return {
+        f"error_{i}": [rf"E{i:04d}: \w+ failed", rf"fatal: component_{i} crashed"]
+        for i in range(patterns_count // 2)
+    }
+
+
+def make_log(lines_count: int, patterns_count: int) -> List[str]:
+    rng = random.Random(0)
+    lines = [
+        f"2023-05-01T10:00:{i % 60:02d}.0000000Z [{rng.choice('ABCDEFGH')}] "
+        f"Compiling module_{rng.randint(0, 1000)}.py ... ok"
+        for i in range(lines_count)
+    ]
+    # About one line in a thousand is a known error
+    for i in range(0, lines_count, 1000):
+        lines[i] = f"E{rng.randrange(patterns_count // 2):04d}: build failed"
+    return lines
+
+
+def naive(patterns: Dict[str, List[str]]) -> Callable[[List[str]], List[str]]:
+    compiled = [
+        (category, re.compile(pattern))
+        for category, category_patterns in patterns.items()
+        for pattern in category_patterns
+    ]
+
+    def classify(lines: List[str]) -> List[str]:
+        found: Dict[str, None] = {}
+        for line in lines:
+            for category, pattern in compiled:
+                if pattern.search(line):
+                    found[category] = None
+        return list(found)
+
+    return classify
+
+
+def measure(classify: Callable[[List[str]], List[str]], lines: List[str]) -> float:
+    start = time.perf_counter()
+    classify(lines)
+    return len(lines) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    lines_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    patterns_count = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    patterns = make_patterns(patterns_count)
+    lines = make_log(lines_count, patterns_count)
+
+    naive_speed = measure(naive(patterns), lines)
+    classifier_speed = measure(ErrorClassifier(patterns).classify, lines)
+    print(f"{lines_count} lines, {patterns_count} patterns")
+    print(f"pattern by pattern: {naive_speed:12,.0f} lines/s")
+    print(
+        f"ErrorClassifier:    {classifier_speed:12,.0f} lines/s "
+        f"({classifier_speed / naive_speed:.1f}x faster)"
+    )
@@ -0,0 +1,77 @@
+"""Compare the msrest deserialization of a timeline with the raw json mode.
+
+Usage: python benchmarks/bench_raw_timeline.py [number_of_records]
+"""
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List
+
+from azure.devops.v7_1.build import models
+from msrest import Deserializer, Serializer
+
+from azpipeline.models import JsonView
+from azpipeline.timeline import TimelineIndex
+
+CLIENT_MODELS = {k: v for k, v in models.__dict__.items() if isinstance(v, type)}
+
+
+def make_payload(records_count: int) -> bytes:
+    records: List[Dict[str, Any]] = []
+    for i in range(records_count):
+        failed = i % 50 == 0
+        records.append(
+            {
+                "id": f"record-{i}",
+                "parentId": f"record-{i // 10}" if i else None,
+                "type": "Task" if i % 10 else "Job",
+                "name": f"Task {i}",
+                "state": "completed",
+                "result": "failed" if failed else "succeeded",
+                "startTime": "2023-05-01T10:00:00.123Z",
+                "finishTime": "2023-05-01T10:05:00.456Z",
+                "order": i,
+                "log": {"id": i, "type": "Container", "url": f"https://logs/{i}"},
+                "issues": [{"type": "error", "message": f"Error {i}"}]
+                if failed
+                else [],
+                "workerName": "Azure Pipelines 2",
+                "errorCount": int(failed),
+                "warningCount": 0,
+                "attempt": 1,
+            }
+        )
+    return json.dumps({"id": "timeline", "changeId": 1, "records": records}).encode()
+
+
+def with_models(payload: bytes) -> Any:
+    timeline = Deserializer(CLIENT_MODELS)("Timeline", json.loads(payload))
+    failed_tasks = TimelineIndex.from_timeline(timeline).find("Task", "failed")
+    return Serializer(CLIENT_MODELS).serialize_object(failed_tasks)
+
+
+def raw(payload: bytes) -> Any:
+    timeline = JsonView(json.loads(payload))
+    failed_tasks = TimelineIndex.from_timeline(timeline).find("Task", "failed")
+    return [task.to_dict() for task in failed_tasks]
+
+
+def measure(function: Callable[[bytes], Any], payload: bytes, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(payload)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+if __name__ == "__main__":
+    records_count = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+    payload = make_payload(records_count)
+    models_time = measure(with_models, payload)
+    raw_time = measure(raw, payload)
+    print(f"{records_count} records, {len(payload) / 1e6:.1f} MB")
+    print(f"msrest models: {models_time * 1000:8.1f} ms")
+    print(
+        f"raw json:      {raw_time * 1000:8.1f} ms ({models_time / raw_time:.1f}x faster)"
+    )
@@ -10,13 +10,14 @@ __copyright__ = """
 
 import logging
 import os
+import re
 import sys
-from collections import defaultdict
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from itertools import groupby
-from operator import itemgetter
+from itertools import islice
 from pathlib import Path
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Pattern, Tuple, Union
 
 from azure.devops.connection import Connection
 from azure.devops.released.build import BuildClient
@@ -24,13 +25,46 @@ from azure.devops.v7_1.build.models import Build, Timeline, TimelineRecord
 from msrest import Serializer
 from msrest.authentication import BasicAuthentication
 
+from azpipeline.archive import LogArchive
+from azpipeline.cache import (
+    CachedBuildClient,
+    DiskCache,
+    MemoryCache,
+    _timeline_ttl,
+)
+from azpipeline.classifier import ErrorClassifier
 from azpipeline.config import Config
-from azpipeline.libs.utils import write_json
-from azpipeline.models import PipelineSummary
+from azpipeline.connection import connection_pool
+from azpipeline.libs.log_file import LogFile
+from azpipeline.libs.logs_zip import ZipLogKey, extract_zip_logs, get_zip_log_key
+from azpipeline.libs.utils import JSONL_SUFFIXES, unwrap_builds, write_jsonl
+from azpipeline.models import (
+    BisectResult,
+    BuildComparison,
+    CompactRecord,
+    Failure,
+    FailureTrend,
+    JsonView,
+    LogHit,
+    PipelineSummary,
+)
+from azpipeline.store import BuildStore
+from azpipeline.timeline import (
+    IncrementalTimeline,
+    TimelineIndex,
+    get_failure_trends,
+    get_failures,
+    get_task_metadata,
+    group_failed_jobs,
+    is_timeline_complete,
+)
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Location id of the build timeline api (see BuildClient.get_build_timeline)
+TIMELINE_LOCATION_ID = "8baac422-4c6e-4de5-8532-db96d92acffa"
+
 
 @dataclass
 class AzurePipeline(Connection):
@@ -40,6 +74,17 @@ class AzurePipeline(Connection):
     project: str = ""
     save_logs: bool = False
     logs_dir: Path = Config.ADO_LOGS_DIR
+    save_logs_compression: Optional[str] = None
+    max_workers: int = 1
+    share_connection: bool = True
+    disk_cache: bool = False
+    cache_dir: Path = Config.ADO_CACHE_DIR
+    cache_max_size: int = 1 << 30
+    cache: Optional[MemoryCache] = None
+    logs_zip_threshold: Optional[int] = None
+    raw: bool = False
+    store: Optional[BuildStore] = None
+    classifier: Optional[ErrorClassifier] = None
 
     def __post_init__(self) -> None:
         if not self.build_id:
@@ -63,16 +108,103 @@ class AzurePipeline(Connection):
         credentials = BasicAuthentication("", self.token)
         super().__init__(base_url=self.organization_url, creds=credentials)
 
-        # Client object to interface with azure devops builds
-        self._build_client: BuildClient = self.clients.get_build_client()
-
-        # Get the current pipeline build
-        self._build_pipeline: Build = self._build_client.get_build(
-            build_id=self.build_id, project=self.project
+        # The build client and the current build are fetched lazily, on first access
+        self._cached_build_client: Optional[
+            Union[BuildClient, CachedBuildClient]
+        ] = None
+        self._cached_build_pipeline: Optional[Build] = None
+
+        # Cache of the timelines and logs that can't change anymore (completed builds)
+        self._disk_cache: Optional[DiskCache] = (
+            DiskCache(self.cache_dir, max_size=self.cache_max_size)
+            if self.disk_cache
+            else None
         )
 
-        # Serializer object (used for object to dict/json conversion)
-        self._serializer: Serializer = self._build_client._serialize
+        # Index of the last used timeline (to avoid rebuilding it on every call)
+        self._last_index: Optional[Tuple[Timeline, TimelineIndex]] = None
+        # Failures of the builds whose timeline is complete, by build_id
+        self._failures: Dict[str, Dict[str, Failure]] = {}
+
+    @classmethod
+    def for_builds(
+        cls, build_ids: Iterable[Any], batch_size: int = 100, **kwargs: Any
+    ) -> List["AzurePipeline"]:
+        """Create pipelines for many builds at once.
+        The builds are fetched in bulk (batch_size builds per request) instead of one request per build
+
+        Args:
+            build_ids (Iterable[Any]): ids of the builds
+            batch_size (int, optional): maximum number of builds fetched per request
+            **kwargs: other arguments of AzurePipeline (token, organization_url, project...)
+
+        Returns:
+            List[AzurePipeline]: one pipeline per build id, in the same order
+        """
+        pipelines = [cls(build_id=str(build_id), **kwargs) for build_id in build_ids]
+        if not pipelines:
+            return pipelines
+
+        build_client = pipelines[0]._build_client
+        project = pipelines[0].project
+        ids = [pipeline.build_id for pipeline in pipelines]
+        builds: Dict[str, Build] = {}
+        for i in range(0, len(ids), batch_size):
+            batch = ids[i : i + batch_size]
+            logger.info("Getting %s builds in bulk", len(batch))
+            response = build_client.get_builds(project, build_ids=batch, top=len(batch))
+            for build in unwrap_builds(response)[0]:
+                builds[str(build.id)] = build
+
+        for pipeline in pipelines:
+            pipeline._cached_build_client = build_client
+            # Builds missing from the bulk response are still fetched lazily
+            pipeline._cached_build_pipeline = builds.get(pipeline.build_id)
+        return pipelines
+
+    @property
+    def _build_client(self) -> Union[BuildClient, CachedBuildClient]:
+        """Client object to interface with azure devops builds"""
+        if self._cached_build_client is None:
+            if self.share_connection:
+                # Reuse the client (and its http sessions) of other pipelines of the same organization
+                self._cached_build_client = connection_pool.get_build_client(
+                    self.organization_url, self.token or ""
+                )
+            else:
+                self._cached_build_client = self.clients.get_build_client()
+
+            if self.cache is not None:
+                # Cache the build, timeline and builds list calls in memory
+                self._cached_build_client = CachedBuildClient(
+                    self._cached_build_client, self.cache
+                )
+        return self._cached_build_client
+
+    @property
+    def _build_pipeline(self) -> Build:
+        """The current pipeline build"""
+        if self._cached_build_pipeline is None:
+            self._cached_build_pipeline = self._build_client.get_build(
+                build_id=self.build_id, project=self.project
+            )
+        return self._cached_build_pipeline
+
+    @property
+    def _serializer(self) -> Serializer:
+        """Serializer object (used for object to dict/json conversion)"""
+        serializer: Serializer = self._build_client._serialize
+        return serializer
+
+    def prefetch(self) -> "AzurePipeline":
+        """Fetch the build client and the current build right away instead of on first access
+
+        Returns:
+            AzurePipeline: the pipeline itself
+        """
+        logger.debug("Prefetching build with Build id = %s", self.build_id)
+        _ = self._build_pipeline
+        return self
 
     @property
     def build_url(self) -> Any:
@@ -123,38 +255,156 @@ class AzurePipeline(Connection):
 
     def _serialize(self, obj: Any) -> Any:
         """Serialize custom object/instance into dict/json"""
+        # Raw (JsonView) and compact objects serialize themselves
+        if isinstance(obj, (JsonView, CompactRecord)):
+            return obj.to_dict()
+        if (
+            isinstance(obj, list)
+            and obj
+            and isinstance(obj[0], (JsonView, CompactRecord))
+        ):
+            return [item.to_dict() for item in obj]
         return self._serializer.serialize_object(obj)
 
-    def get_timeline(self, build_id: Optional[str] = None) -> Timeline:
+    def get_timeline_index(self, timeline: Timeline) -> TimelineIndex:
+        """Get the index of a timeline. The index of the last used timeline is reused
+
+        Args:
+            timeline (Timeline): Timeline of the azure pipeline
+
+        Returns:
+            TimelineIndex: index for fast lookups of the timeline records
+        """
+        if self._last_index is not None:
+            indexed_timeline, index = self._last_index
+            if indexed_timeline is timeline and len(index) == len(
+                timeline.records or []
+            ):
+                return index
+
+        index = TimelineIndex.from_timeline(timeline)
+        self._last_index = (timeline, index)
+        return index
+
+    def get_timeline(self, build_id: Optional[str] = None) -> Union[Timeline, JsonView]:
         """Get timeline of an azure devops pipeline
 
         Args:
             build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
 
         Returns:
-            Timeline: Timeline of the azure pipeline
+            Union[Timeline, JsonView]: Timeline of the azure pipeline. In raw mode, a JsonView over the api response
+                with the same attributes (faster for large timelines, dates are not parsed)
         """
 
         # Use build_id for the current pipeline if not custom one is provided
         if not build_id:
             build_id = self.build_id
 
-        logger.info("Getting timeline for pipeline with Build id = %s", build_id)
-        timeline: Timeline = self._build_client.get_build_timeline(
-            build_id=build_id, project=self.project
-        )
-        if not timeline:
-            logger.error("Timeline not found")
-            sys.exit(1)
+        timeline = self._get_cached_timeline(build_id)
+        if timeline is None:
+            logger.info("Getting timeline for pipeline with Build id = %s", build_id)
+            if self.raw:
+                timeline = self._get_raw_timeline(build_id)
+            else:
+                timeline = self._build_client.get_build_timeline(
+                    build_id=build_id, project=self.project
+                )
+            if not timeline:
+                logger.error("Timeline not found")
+                sys.exit(1)
+            self._cache_timeline(build_id, timeline)
 
         if self.save_logs:
-            write_json(
-                output_path=Path(self.logs_dir, "timeline.json"),
-                obj=self._serialize(timeline),
+            self._save_jsonl(
+                "timeline", (self._serialize(r) for r in timeline.records or [])
             )
 
         return timeline
 
+    def _save_jsonl(self, name: str, records: Iterable[Any]) -> None:
+        """Stream records to <logs_dir>/<name>.jsonl (.gz or .zst when compressed)"""
+        suffix = JSONL_SUFFIXES.get(self.save_logs_compression, ".jsonl")
+        output_path = Path(self.logs_dir, name + suffix)
+        count = write_jsonl(output_path, records, self.save_logs_compression)
+        logger.debug("Saved %s records to %s", count, output_path)
+
+    def _cache_key(self, build_id: Any, *parts: Any) -> Tuple[Any, ...]:
+        """Key of the data of a build in the disk cache"""
+        return (self.organization_url, self.project, build_id, *parts)
+
+    def _get_cached_timeline(
+        self, build_id: Any
+    ) -> Optional[Union[Timeline, JsonView]]:
+        """Get a timeline from the disk cache, None if it is not cached"""
+        if self._disk_cache is None:
+            return None
+        data = self._disk_cache.get_json(self._cache_key(build_id, "timeline.json"))
+        if data is None:
+            return None
+        logger.info("Timeline of build %s loaded from the disk cache", build_id)
+        if self.raw:
+            return JsonView(data)
+        timeline: Timeline = self._build_client._deserialize("Timeline", data)
+        return timeline
+
+    def _get_raw_timeline(self, build_id: Any) -> Optional[JsonView]:
+        """Get a timeline as parsed json, without deserializing it into msrest models.
+        With cache, raw timelines are cached like the timelines of the CachedBuildClient
+
+        Returns:
+            Optional[JsonView]: view over the json timeline, with the same attributes as a Timeline
+        """
+        if self.cache is None:
+            return self._fetch_raw_timeline(build_id)
+        key = (self.organization_url, "raw_timeline", self.project, str(build_id))
+        missing = object()
+        value = self.cache.get(key, missing)
+        if value is missing:
+            value = self._fetch_raw_timeline(build_id)
+            self.cache.set(key, value, ttl=_timeline_ttl(value, self.cache.ttl))
+        timeline: Optional[JsonView] = value
+        return timeline
+
+    def _fetch_raw_timeline(self, build_id: Any) -> Optional[JsonView]:
+        """Request a timeline from the api, as parsed json"""
+        route_values = {
+            "project": self._serializer.url("project", self.project, "str"),
+            "buildId": self._serializer.url("build_id", build_id, "int"),
+        }
+        response = self._build_client._send(
+            http_method="GET",
+            location_id=TIMELINE_LOCATION_ID,
+            version="7.0",
+            route_values=route_values,
+        )
+        if not response.content:
+            return None
+        return JsonView(response.json())
+
+    def _cache_timeline(self, build_id: Any, timeline: Timeline) -> None:
+        """Store a timeline in the disk cache, if it is complete (i.e. it won't change anymore)"""
+        if self._disk_cache is not None and is_timeline_complete(timeline):
+            self._disk_cache.put_json(
+                self._cache_key(build_id, "timeline.json"), self._serialize(timeline)
+            )
+
+    def get_incremental_timeline(
+        self, build_id: Optional[str] = None
+    ) -> IncrementalTimeline:
+        """Get a timeline that only fetches the changed records on each refresh.
+        Useful to poll the timeline of a running pipeline.
+
+        Args:
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            IncrementalTimeline: timeline to refresh, e.g. IncrementalTimeline.refresh()
+        """
+        return IncrementalTimeline(
+            self._build_client, project=self.project, build_id=build_id or self.build_id
+        )
+
     def get_failed_tasks(self, timeline: Timeline) -> List[TimelineRecord]:
         """Get failed tasks from the whole pipeline timeline
 
@@ -166,16 +416,10 @@ class AzurePipeline(Connection):
         """
 
         logger.debug("Getting all failed tasks for ado pipeline...")
-        failed_tasks = []
-        for record in timeline.records:
-            if record.result == "failed" and record.type == "Task":
-                failed_tasks.append(record)
+        failed_tasks = list(self.get_timeline_index(timeline).find("Task", "failed"))
 
         if self.save_logs:
-            write_json(
-                output_path=Path(self.logs_dir, "failed_tasks.json"),
-                obj=self._serialize(failed_tasks),
-            )
+            self._save_jsonl("failed_tasks", (self._serialize(t) for t in failed_tasks))
 
         logger.debug(
             "Failed tasks have been extracted successfully -> length=%s",
@@ -183,11 +427,21 @@ class AzurePipeline(Connection):
         )
         return failed_tasks
 
-    def get_failed_tasks_logs(self, timeline: Timeline) -> Tuple[dict, dict]:
+    def get_failed_tasks_logs(
+        self, timeline: Timeline, max_workers: Optional[int] = None
+    ) -> Tuple[dict, dict]:
         """Get logs for failed tasks (that failed during the pipeline execution)
 
         Args:
-            failed_tasks (List[TimelineRecord]): List of failed/errored pipeline tasks
+            timeline (Timeline): Timeline of the azure pipeline
+            max_workers (Optional[int], optional): number of threads used to download the logs concurrently.
+                If None, self.max_workers will be used. A value of 1 downloads the logs one after the other
+
+        With logs_zip_threshold set, when more than logs_zip_threshold logs have to be downloaded,
+        the logs zip of the build is downloaded once instead, and only the logs of the failed tasks
+        are extracted from it (logs that can't be matched unambiguously are downloaded on their own).
+        With save_logs, the logs are stored in the LogArchive under <logs_dir>/archive.
+        With a classifier, the metadata of each task has the categories of the known errors in its log.
 
         Returns:
             Tuple[dict, dict]: dict task_name to log, dict task_name to metadata
@@ -195,66 +449,445 @@ class AzurePipeline(Connection):
 
         logger.debug("Getting all logs for failed tasks in ado pipeline...")
         failed_tasks: List[TimelineRecord] = self.get_failed_tasks(timeline=timeline)
+        index = self.get_timeline_index(timeline)
         logs = {}
         metadata = {}
 
-        for task in failed_tasks:
-            task_metadata = {}
-            log_id = task.log.id
+        tasks_logs = self._get_tasks_logs(
+            failed_tasks, index, max_workers=max_workers or self.max_workers
+        )
 
-            # Get logs of the failed pipeline task
-            task_log = self._build_client.get_build_log_lines(
-                project=self.project, build_id=self.build_id, log_id=log_id
-            )
+        for task, task_log in zip(failed_tasks, tasks_logs):
             logs[task.name] = task_log
-
-            # Extract the issue messages of a task, if exist.
-            task_metadata["issues"] = [d.message for d in task.issues]
             logger.info(
                 "searching parent for: %s with parent_id: %s", task.name, task.parent_id
             )
-
-            for record in timeline.records:
-                if record.type == "Job" and record.id == task.parent_id:
-                    task_metadata["parent"] = record.name
-            metadata[task.name] = task_metadata
+            metadata[task.name] = get_task_metadata(index, task)
+            if self.classifier is not None:
+                metadata[task.name]["categories"] = self.classifier.classify(task_log)
 
         if self.save_logs:
-            write_json(output_path=Path(self.logs_dir, "tasks_logs.json"), obj=logs)
-            write_json(
-                output_path=Path(self.logs_dir, "tasks_metadata.json"), obj=metadata
+            archive = LogArchive(
+                Path(self.logs_dir, "archive"), self.save_logs_compression or "gzip"
+            )
+            archive.add_build(self.build_id, logs)
+            self._save_jsonl(
+                "tasks_metadata", ({"task": k, **v} for k, v in metadata.items())
             )
 
         logger.debug("Logs have been extracted successfully -> length=%s", len(logs))
         return logs, metadata
 
-    def get_previous_builds(self) -> Any:
-        """Return a list of previous builds
+    def iter_log_lines(
+        self,
+        log_id: int,
+        start_line: int = 1,
+        end_line: Optional[int] = None,
+        chunk_size: int = 10000,
+        build_id: Optional[str] = None,
+    ) -> Iterator[str]:
+        """Iterate lazily over the lines of a log.
+        The log is requested chunk by chunk (chunk_size lines per api call), so only one chunk is held in memory.
+        Logs of the current build in the disk cache are read from the cache
+
+        Args:
+            log_id (int): id of the log
+            start_line (int, optional): first line to read (lines are numbered from 1)
+            end_line (Optional[int], optional): last line to read (included). If None, read until the end of the log
+            chunk_size (int, optional): number of lines requested per api call
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Yields:
+            Iterator[str]: lines of the log
+        """
+        log_file = self._open_cached_log(log_id, build_id)
+        if log_file is not None:
+            # Cached logs are read from the memory mapped file, chunk by chunk too
+            with log_file:
+                stop = (
+                    len(log_file) if end_line is None else min(end_line, len(log_file))
+                )
+                for first in range(start_line - 1, stop, chunk_size):
+                    yield from log_file[first : min(first + chunk_size, stop)]
+            return
+
+        while end_line is None or start_line <= end_line:
+            last_line = start_line + chunk_size - 1
+            if end_line is not None:
+                last_line = min(last_line, end_line)
+
+            lines: List[str] = self._build_client.get_build_log_lines(
+                project=self.project,
+                build_id=build_id or self.build_id,
+                log_id=log_id,
+                start_line=start_line,
+                end_line=last_line,
+            )
+            yield from lines
+
+            # A short chunk means the end of the log was reached
+            if len(lines) < last_line - start_line + 1:
+                return
+            start_line = last_line + 1
+
+    def get_log_line_count(self, log_id: int, build_id: Optional[str] = None) -> int:
+        """Get the number of lines of a log
+
+        Args:
+            log_id (int): id of the log
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
 
         Returns:
-            _type_: _description_
+            int: number of lines of the log (0 if the log was not found)
         """
+        build_logs = self._build_client.get_build_logs(
+            project=self.project, build_id=build_id or self.build_id
+        )
+        for build_log in build_logs or []:
+            if build_log.id == log_id:
+                return int(build_log.line_count or 0)
+        return 0
+
+    def head_log_lines(
+        self, log_id: int, n: int = 100, build_id: Optional[str] = None
+    ) -> List[str]:
+        """Get the first n lines of a log
 
-        builds = self._build_client.get_builds(
-            self.project,
-            definitions=[self._build_pipeline.definition.id],
-            branch_name=self._build_pipeline.source_branch,
-            query_order="startTimeDescending",
+        Args:
+            log_id (int): id of the log
+            n (int, optional): number of lines
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            List[str]: first lines of the log
+        """
+        if n <= 0:
+            return []
+        return list(
+            self.iter_log_lines(log_id, end_line=n, chunk_size=n, build_id=build_id)
         )
 
-        list_builds = []
-        if builds.value:
-            for past_build in builds.value:
-                list_builds.append(past_build.id)
+    def tail_log_lines(
+        self, log_id: int, n: int = 100, build_id: Optional[str] = None
+    ) -> List[str]:
+        """Get the last n lines of a log (e.g. to see why a task failed)
 
-        logger.info("List of builds %s", list_builds)
-        if len(list_builds) > 1:
-            build_index = list_builds.index(self._build_pipeline.id)
-            if build_index + 1 < len(list_builds):
-                return list_builds[build_index + 1]
-            else:
-                return None
-        return None
+        Args:
+            log_id (int): id of the log
+            n (int, optional): number of lines
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            List[str]: last lines of the log
+        """
+        log_file = self._open_cached_log(log_id, build_id)
+        if log_file is not None:
+            with log_file:
+                return log_file.tail(n)
+
+        line_count = self.get_log_line_count(log_id, build_id=build_id)
+        if n <= 0 or line_count == 0:
+            return []
+        return list(
+            self.iter_log_lines(
+                log_id,
+                start_line=max(1, line_count - n + 1),
+                end_line=line_count,
+                chunk_size=n,
+                build_id=build_id,
+            )
+        )
+
+    def open_log(self, log_id: int) -> LogFile:
+        """Open a log of the current build for random access to its lines, e.g.
+        log[1000:1100], log.tail(50) or log.grep("error"), without reading the whole log.
+        The log is read from the disk cache (it is downloaded and cached first if needed),
+        so disk_cache must be enabled. Close the log file when done (or use it in a with block)
+
+        Args:
+            log_id (int): id of the log
+
+        Returns:
+            LogFile: memory mapped log
+        """
+        if self._disk_cache is None:
+            raise ValueError("open_log requires the disk cache (disk_cache=True)")
+        log_file = self._open_cached_log(log_id)
+        if log_file is None:
+            self._get_log(log_id)
+            log_file = self._open_cached_log(log_id)
+        if log_file is None:
+            # Already evicted, e.g. the log is larger than the cache
+            raise FileNotFoundError(f"Log {log_id} could not be kept in the disk cache")
+        return log_file
+
+    def search_logs(
+        self,
+        pattern: Union[str, Pattern],
+        build_ids: Optional[Iterable[Any]] = None,
+        scope: str = "failed",
+        max_hits: Optional[int] = None,
+        max_workers: Optional[int] = None,
+        snippet_length: int = 200,
+    ) -> List[LogHit]:
+        """Search the logs of the tasks of some builds for a regex.
+        Logs are streamed (from the disk cache or chunk by chunk from the api) and scanned
+        concurrently, and the search stops as soon as max_hits lines matched
+
+        Args:
+            pattern (Union[str, Pattern]): regex searched in each line of the logs
+            build_ids (Optional[Iterable[Any]], optional): builds to search. If None, the current build
+            scope (str, optional): "failed" to search the logs of the failed tasks, "all" for all the tasks
+            max_hits (Optional[int], optional): stop after max_hits matching lines. If None, find all of them
+            max_workers (Optional[int], optional): number of logs scanned in parallel. If None, self.max_workers
+            snippet_length (int, optional): maximum length of the snippets of the matching lines
+
+        Returns:
+            List[LogHit]: matching lines, ordered by build (in the order of build_ids), task and line
+        """
+        if scope not in ("failed", "all"):
+            raise ValueError(f"Unknown scope {scope}, expected failed or all")
+        regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+        build_ids = [str(build_id) for build_id in build_ids or [self.build_id]]
+        hits: List[Tuple[int, int, LogHit]] = []
+        lock = threading.Lock()
+        done = threading.Event()
+
+        def search_log(build: int, position: int, task: Any) -> None:
+            build_id = build_ids[build]
+            for line_number, line in self._grep_log(regex, task.log.id, build_id, done):
+                with lock:
+                    if done.is_set():
+                        return
+                    hit = LogHit(
+                        build_id, task.name, line_number, line[:snippet_length]
+                    )
+                    hits.append((build, position, hit))
+                    if max_hits is not None and len(hits) >= max_hits:
+                        done.set()
+
+        workers = max(1, max_workers or self.max_workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for build, timeline in enumerate(
+                executor.map(self.get_timeline, build_ids)
+            ):
+                index = TimelineIndex.from_timeline(timeline)
+                tasks = (
+                    index.find("Task", "failed")
+                    if scope == "failed"
+                    else index.by_type("Task")
+                )
+                futures += [
+                    executor.submit(search_log, build, position, task)
+                    for position, task in enumerate(tasks)
+                    if task.log and not done.is_set()
+                ]
+            for future in futures:
+                future.result()
+
+        logger.info("Found %s lines matching %s", len(hits), regex.pattern)
+        return [hit for _, _, hit in sorted(hits, key=lambda hit: hit[:2])]
+
+    def _grep_log(
+        self, regex: Pattern, log_id: int, build_id: str, done: threading.Event
+    ) -> Iterator[Tuple[int, str]]:
+        """Iterate over the matching lines of a log (line numbers from 1) until done is set"""
+        log_file = self._open_cached_log(log_id, build_id)
+        if log_file is not None:
+            with log_file:
+                for line_number, line in log_file.grep(regex):
+                    if done.is_set():
+                        return
+                    yield line_number + 1, line
+            return
+
+        lines = self.iter_log_lines(log_id, build_id=build_id)
+        for line_number, line in enumerate(lines, start=1):
+            if done.is_set():
+                return
+            if regex.search(line):
+                yield line_number, line
+
+    def _open_cached_log(
+        self, log_id: int, build_id: Optional[str] = None
+    ) -> Optional[LogFile]:
+        """Open a log of a build (the current one if build_id is None) from the disk cache,
+        None if it is not cached"""
+        if self._disk_cache is None:
+            return None
+        return self._disk_cache.open_lines(
+            self._cache_key(build_id or self.build_id, "logs", f"{log_id}.log")
+        )
+
+    def _get_cached_log(self, log_id: int) -> Optional[List[str]]:
+        """Get a log of the current build from the disk cache, None if it is not cached"""
+        if self._disk_cache is None:
+            return None
+        return self._disk_cache.get_lines(
+            self._cache_key(self.build_id, "logs", f"{log_id}.log")
+        )
+
+    def _cache_log(self, log_id: int, lines: List[str]) -> None:
+        """Store a log of the current build in the disk cache"""
+        if self._disk_cache is not None:
+            self._disk_cache.put_lines(
+                self._cache_key(self.build_id, "logs", f"{log_id}.log"), lines
+            )
+
+    def _get_log(self, log_id: int) -> List[str]:
+        """Get the lines of a single log of the current build.
+        Only used for logs of failed tasks: these tasks are finished, so their logs can be cached
+        """
+        cached_lines = self._get_cached_log(log_id)
+        if cached_lines is not None:
+            return cached_lines
+
+        lines: List[str] = self._build_client.get_build_log_lines(
+            project=self.project, build_id=self.build_id, log_id=log_id
+        )
+        self._cache_log(log_id, lines)
+        return lines
+
+    def _get_tasks_logs(
+        self, tasks: List[TimelineRecord], index: TimelineIndex, max_workers: int = 1
+    ) -> List[List[str]]:
+        """Get the logs of finished tasks of the current build, in the same order as tasks.
+        Logs are read from the disk cache, from the logs zip if many logs are missing,
+        and otherwise downloaded one by one (in parallel if max_workers > 1)
+        """
+        logs: Dict[int, List[str]] = {}
+        for task in tasks:
+            cached_lines = self._get_cached_log(task.log.id)
+            if cached_lines is not None:
+                logs[task.log.id] = cached_lines
+
+        missing_tasks = [task for task in tasks if task.log.id not in logs]
+        if (
+            self.logs_zip_threshold is not None
+            and len(missing_tasks) > self.logs_zip_threshold
+        ):
+            zip_logs = self._get_logs_from_zip(missing_tasks, index)
+            for log_id, lines in zip_logs.items():
+                self._cache_log(log_id, lines)
+            logs.update(zip_logs)
+
+        # Logs that were not found in the zip are downloaded one by one
+        missing_ids = [task.log.id for task in tasks if task.log.id not in logs]
+        logs.update(
+            zip(missing_ids, self._get_logs(missing_ids, max_workers=max_workers))
+        )
+        return [logs[task.log.id] for task in tasks]
+
+    def _get_logs_from_zip(
+        self, tasks: List[TimelineRecord], index: TimelineIndex
+    ) -> Dict[int, List[str]]:
+        """Extract the logs of some tasks out of the logs zip of the current build
+
+        Returns:
+            Dict[int, List[str]]: lines of the logs found in the zip, by log id
+        """
+        wanted: Dict[ZipLogKey, int] = {}
+        duplicates = set()
+        for task in tasks:
+            # The zip has a folder by stage and by job (not by phase)
+            folders: List[str] = []
+            parent = index.parent(task)
+            while parent is not None:
+                if parent.type in ("Stage", "Job"):
+                    folders.insert(0, parent.name)
+                parent = index.parent(parent)
+            key = get_zip_log_key(folders, task.order or 0, task.name)
+            if key in wanted:
+                duplicates.add(key)
+            wanted[key] = task.log.id
+        # Tasks that can't be told apart in the zip get their logs downloaded one by one
+        for key in duplicates:
+            del wanted[key]
+        if not wanted:
+            return {}
+
+        logger.info(
+            "Extracting %s logs from the logs zip of build %s",
+            len(tasks),
+            self.build_id,
+        )
+        chunks = self._build_client.get_build_logs_zip(
+            project=self.project, build_id=self.build_id
+        )
+        return extract_zip_logs(chunks, wanted)
+
+    def _get_logs(self, log_ids: List[int], max_workers: int = 1) -> List[List[str]]:
+        """Get the lines of several logs of the current build.
+        The returned list has the same order as log_ids.
+
+        Args:
+            log_ids (List[int]): ids of the logs to download
+            max_workers (int, optional): size of the thread pool used for the download
+
+        Returns:
+            List[List[str]]: lines of each log
+        """
+        if max_workers <= 1 or len(log_ids) <= 1:
+            return [self._get_log(log_id) for log_id in log_ids]
+
+        logger.debug("Downloading %s logs with %s workers", len(log_ids), max_workers)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(log_ids))) as executor:
+            return list(executor.map(self._get_log, log_ids))
+
+    def iter_previous_builds(self, page_size: int = 50) -> Iterator[Build]:
+        """Iterate over the builds of the same definition and branch that started
+        before the current one, from the newest to the oldest.
+        Builds are requested page by page (page_size builds per request), only when needed
+
+        Args:
+            page_size (int, optional): number of builds requested per api call
+
+        Yields:
+            Iterator[Build]: previous builds
+        """
+        current = self._build_pipeline
+        max_time = current.start_time or current.queue_time
+        continuation_token = None
+        seen = {current.id}
+
+        while True:
+            response = self._build_client.get_builds(
+                self.project,
+                definitions=[current.definition.id],
+                branch_name=current.source_branch,
+                query_order="startTimeDescending",
+                max_time=max_time,
+                top=page_size,
+                continuation_token=continuation_token,
+            )
+            builds, continuation_token = unwrap_builds(response)
+            logger.info("List of builds %s", [build.id for build in builds])
+
+            new_builds = [build for build in builds if build.id not in seen]
+            for build in new_builds:
+                seen.add(build.id)
+                yield build
+
+            if not continuation_token:
+                if len(builds) < page_size or not new_builds:
+                    return
+                # No continuation token returned: continue from the oldest build of the page
+                max_time = builds[-1].start_time
+
+    def get_previous_builds(self) -> Any:
+        """Return the id of the build that ran before the current one
+        on the same definition and branch
+
+        Returns:
+            Any: id of the previous build, None if there is none
+        """
+        if self.store is not None and self.store.has_build(self.build_id):
+            return self.store.get_previous_build(self.build_id)
+
+        # The current build can be part of the first page, hence 2 builds per page
+        previous_build = next(self.iter_previous_builds(page_size=2), None)
+        return previous_build.id if previous_build else None
 
     # flake8: noqa: C901
     def failed_jobs(self, build_id: Optional[str] = None) -> Any:
@@ -274,49 +907,38 @@ class AzurePipeline(Connection):
             build_id = self.build_id
 
         timeline = self.get_timeline(build_id)
-        failed_job_records: Any = defaultdict(list)
-        list_errors: List = []
-
-        for record in timeline.records:
-            if record.result == "failed" and record.type == "Job":
-                failed_job_records[record.type].append(record)
-                logger.info("failed_job_records: %s", failed_job_records)
-
-        # Create a section for each error
-        if "Job" in failed_job_records.keys():
-            for record in failed_job_records["Job"]:
-                error = {
-                    "stage": "JobStageErrors",
-                    "job": record.name,
-                }
-                if error not in list_errors:
-                    list_errors.append(error)
-
-        if len(list_errors) > 0:
-            # Display data grouped by stage
-            group_list: Any = {}
-            for key, value in groupby(list_errors, key=itemgetter("stage")):
-                jobs = []
-                group_list[key] = {}
-                for k in value:
-                    if k["job"] not in jobs:
-                        jobs.append(k["job"])
-                group_list[key]["jobs"] = sorted(jobs)
-            return group_list
-        else:
-            return list_errors
+        return group_failed_jobs(self.get_timeline_index(timeline))
+
+    def get_failures(self, build_id: Optional[str] = None) -> Dict[str, Failure]:
+        """Get the failures of a build by fingerprint (see timeline.get_failures).
+        They are computed once per build, when its timeline is complete.
+
+        Args:
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            Dict[str, Failure]: failures of the build by fingerprint
+        """
+        build_id = str(build_id or self.build_id)
+        failures = self._failures.get(build_id)
+        if failures is None:
+            timeline = self.get_timeline(build_id)
+            failures = get_failures(self.get_timeline_index(timeline))
+            if is_timeline_complete(timeline):
+                self._failures[build_id] = failures
+        return failures
 
     def compare_with_prev_build(
         self, prev_build: Optional[str], curr_build: Optional[str] = None
-    ) -> Optional[str]:
+    ) -> BuildComparison:
         """Compare two builds. Generally the current build with the previous one
 
         Args:
-            prev_build (_type_): previous build_id
+            prev_build (Optional[str]): previous build_id. If None, the current build is compared to no failures
             curr_build (Optional[str], optional): current build_id. If None, the current will be used
 
         Returns:
-            Optional[str]: feedback message that shows comparison of current build with the previous one
+            BuildComparison: new, fixed and repeated failures. Its message shows the comparison as text
         """
         # Set curr_build to the current build_id if no custom one is provided
         if not curr_build:
@@ -326,31 +948,93 @@ class AzurePipeline(Connection):
             "Compare previous build: %s to current build: %s", prev_build, curr_build
         )
 
-        curr_error = self.get_list_of_errors(curr_build)
-        logger.info("Current  builds errors: %s", curr_error)
-        # previous error sometimes is empty
-        if prev_build:
-            prev_error = self.get_list_of_errors(prev_build)
-        else:
-            prev_error = {}
-        logger.info("Previous builds errors: %s", prev_error)
+        curr_failures = self.get_failures(curr_build)
+        prev_failures = self.get_failures(prev_build) if prev_build else {}
+        logger.info("Current failures =%s", len(curr_failures))
+        logger.info("Previous failures =%s", len(prev_failures))
+
+        comparison = BuildComparison(
+            prev_build=prev_build,
+            curr_build=curr_build,
+            new=[f for key, f in curr_failures.items() if key not in prev_failures],
+            fixed=[f for key, f in prev_failures.items() if key not in curr_failures],
+            repeated=[f for key, f in curr_failures.items() if key in prev_failures],
+        )
+        logger.info("Out message =%s", comparison.message)
+        return comparison
+
+    def get_failure_trends(
+        self, window: int = 20, max_workers: Optional[int] = None
+    ) -> Dict[str, FailureTrend]:
+        """Get the trend of the failures over the current build and the previous ones
+        on the same definition and branch, e.g. the build since which a failure is failing.
+        Timelines are fetched concurrently, only the failures of each build are kept.
+
+        Args:
+            window (int, optional): number of builds, including the current one
+            max_workers (Optional[int], optional): number of timelines fetched in parallel. If None, self.max_workers
 
-        logger.info("Current error =%s", len(curr_error))
-        logger.info("Previous error =%s", len(prev_error))
+        Returns:
+            Dict[str, FailureTrend]: trends by fingerprint, longest streaks first
+        """
+        previous_builds = islice(
+            self.iter_previous_builds(page_size=window + 1), max(window - 1, 0)
+        )
+        build_ids = [self.build_id] + [str(build.id) for build in previous_builds]
+        logger.info("Failure trends over builds %s", build_ids)
 
-        message = None
+        workers = max(1, max_workers or self.max_workers)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            history = list(zip(build_ids, executor.map(self.get_failures, build_ids)))
+        return get_failure_trends(history)
 
-        if len(curr_error) == 0 and len(prev_error) > 0:
-            message = "back to normal"
+    def bisect_failure(self, fingerprint: str, max_builds: int = 1000) -> BisectResult:
+        """Find the build where a failure of the current build first appeared.
 
-        if len(curr_error) > 0 and len(prev_error) > 0:
-            if curr_error == prev_error:
-                message = "repeated failure"
-            else:
-                message = "new failure!"
+        The history of the definition and branch is fetched once, keeping only the build
+        ids, then binary searched, assuming the failure is present in every build since
+        it appeared. Only O(log(max_builds)) timelines are fetched.
 
-        if len(curr_error) > 0 and len(prev_error) == 0:
-            message = "new failure!"
+        Args:
+            fingerprint (str): fingerprint of a failure of the current build (see get_failures)
+            max_builds (int, optional): maximum number of previous builds to search
 
-        logger.info("Out message =%s", message)
-        return message
+        Returns:
+            BisectResult: first failing and last passing builds, and the number of timelines fetched
+                (builds whose failures were already known don't count)
+        """
+        fetched = 0
+
+        def get_failures(build_id: str) -> Dict[str, Failure]:
+            nonlocal fetched
+            if build_id not in self._failures:
+                fetched += 1
+            return self.get_failures(build_id)
+
+        if fingerprint not in get_failures(str(self.build_id)):
+            raise ValueError(
+                f"Failure {fingerprint} is not a failure of build {self.build_id}"
+            )
+
+        previous_builds = islice(
+            self.iter_previous_builds(page_size=min(max_builds + 1, 500)), max_builds
+        )
+        history = [str(self.build_id)] + [str(build.id) for build in previous_builds]
+        logger.info("Bisecting %s over %s builds", fingerprint, len(history))
+
+        # history[failing] has the failure, history[passing] doesn't (or is out of the history)
+        failing, passing = 0, len(history)
+        while passing - failing > 1:
+            middle = (failing + passing) // 2
+            if fingerprint in get_failures(history[middle]):
+                failing = middle
+            else:
+                passing = middle
+
+        return BisectResult(
+            fingerprint=fingerprint,
+            first_failing=history[failing],
+            last_passing=history[passing] if passing < len(history) else None,
+            builds_searched=len(history),
+            timelines_fetched=fetched,
+        )
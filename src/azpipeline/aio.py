@@ -0,0 +1,251 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import sys
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+from azure.devops.v7_1.build import models
+from azure.devops.v7_1.build.models import Build, Timeline, TimelineRecord
+from msrest import Deserializer
+
+from azpipeline.classifier import ErrorClassifier
+from azpipeline.models import PipelineSummary
+from azpipeline.timeline import TimelineIndex, get_task_metadata, group_failed_jobs
+
+if TYPE_CHECKING:
+    import aiohttp
+else:
+    try:
+        import aiohttp
+    except ImportError:  # pragma: no cover
+        aiohttp = None
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+API_VERSION = "7.0"
+
+
+def _basic_auth(token: Optional[str]) -> str:
+    """Encode a personal access token for basic authentication (empty user name)"""
+    return base64.b64encode(f":{token}".encode()).decode()
+
+
+@dataclass
+class AsyncAzurePipeline:
+    """Asyncio variant of AzurePipeline, based on aiohttp.
+
+    All the network calls are coroutines. Requests go through a single
+    aiohttp.ClientSession with a connection pool of max_connections, which can be
+    shared between many instances (pass the same session) to monitor a lot of
+    builds from one event loop.
+
+    Example:
+        async with AsyncAzurePipeline(build_id=..., token=..., organization_url=..., project=...) as pipeline:
+            timeline = await pipeline.get_timeline()
+    """
+
+    build_id: str
+    token: Optional[str] = os.getenv("AZURE_PIPELINES_TOKEN", None)
+    organization_url: str = ""
+    project: str = ""
+    max_connections: int = 100
+    session: Optional[Any] = None
+    classifier: Optional[ErrorClassifier] = None
+    _build_pipeline: Optional[Build] = field(default=None, init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        if aiohttp is None:
+            raise ImportError(
+                "AsyncAzurePipeline requires aiohttp. Install it with: pip install azpipeline[async]"
+            )
+
+        if not self.build_id:
+            logger.error(
+                "Something wrong with the BuildId: %s. Please provide an existent one.",
+                self.build_id,
+            )
+            sys.exit(1)
+
+        if not self.token:
+            logger.error(
+                "Azure Pipeline token not found. Please set the AZURE_PIPELINES_TOKEN environment variable."
+            )
+            sys.exit(1)
+
+        # Only close the session on exit if it was created by this instance
+        self._owns_session = self.session is None
+        self._deserializer = Deserializer(
+            {k: v for k, v in models.__dict__.items() if isinstance(v, type)}
+        )
+
+    async def __aenter__(self) -> "AsyncAzurePipeline":
+        return self
+
+    async def __aexit__(self, *exc_details: Any) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        """Close the http session, if it was created by this instance"""
+        if self._owns_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def _get_session(self) -> Any:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                headers={"Authorization": f"Basic {_basic_auth(self.token)}"},
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                raise_for_status=True,
+            )
+        return self.session
+
+    async def _get(self, path: str, **params: Any) -> Any:
+        """Send a GET request to the build api of the project and return the json response"""
+        url = f"{self.organization_url.rstrip('/')}/{self.project}/_apis/build/{path}"
+        params = {k: str(v) for k, v in params.items() if v is not None}
+        params["api-version"] = API_VERSION
+        async with self._get_session().get(
+            url, params=params, headers={"Accept": "application/json"}
+        ) as response:
+            return await response.json()
+
+    async def get_build(self, build_id: Optional[str] = None) -> Build:
+        """Get a build. The current build is only fetched once
+
+        Args:
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            Build: the azure pipeline build
+        """
+        if build_id and str(build_id) != str(self.build_id):
+            data = await self._get(f"builds/{build_id}")
+            return self._deserializer("Build", data)
+
+        if self._build_pipeline is None:
+            data = await self._get(f"builds/{self.build_id}")
+            self._build_pipeline = self._deserializer("Build", data)
+        return self._build_pipeline
+
+    async def summary(self) -> PipelineSummary:
+        """Get an overview of important/useful infos about the pipeline."""
+        build = await self.get_build()
+        return PipelineSummary(
+            name=build.definition.name,
+            build_id=self.build_id,
+            result=build.result,
+            status=build.status,
+            url=build._links.additional_properties["web"]["href"],
+            branch=build.source_branch,
+            commit_id=build.source_version,
+            triggered_by=build.requested_by.display_name,
+        )
+
+    async def get_timeline(self, build_id: Optional[str] = None) -> Timeline:
+        """Get timeline of an azure devops pipeline
+
+        Args:
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            Timeline: Timeline of the azure pipeline
+        """
+        if not build_id:
+            build_id = self.build_id
+
+        logger.info("Getting timeline for pipeline with Build id = %s", build_id)
+        data = await self._get(f"builds/{build_id}/timeline")
+        if not data:
+            logger.error("Timeline not found")
+            sys.exit(1)
+        return self._deserializer("Timeline", data)
+
+    def get_failed_tasks(self, timeline: Timeline) -> List[TimelineRecord]:
+        """Get failed tasks from the whole pipeline timeline
+
+        Args:
+            timeline (Timeline): Timeline of the azure pipeline
+
+        Returns:
+            List[TimelineRecord]: List of failed/errored pipeline tasks
+        """
+        return list(TimelineIndex.from_timeline(timeline).find("Task", "failed"))
+
+    async def get_log(self, log_id: int, build_id: Optional[str] = None) -> List[str]:
+        """Get the lines of a log
+
+        Args:
+            log_id (int): id of the log
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            List[str]: lines of the log
+        """
+        data = await self._get(f"builds/{build_id or self.build_id}/logs/{log_id}")
+        lines: List[str] = data["value"]
+        return lines
+
+    async def get_failed_tasks_logs(self, timeline: Timeline) -> Tuple[dict, dict]:
+        """Get logs for failed tasks (that failed during the pipeline execution).
+        The logs are downloaded concurrently
+
+        Args:
+            timeline (Timeline): Timeline of the azure pipeline
+
+        Returns:
+            Tuple[dict, dict]: dict task_name to log, dict task_name to metadata
+        """
+        index = TimelineIndex.from_timeline(timeline)
+        failed_tasks = index.find("Task", "failed")
+        tasks_logs = await asyncio.gather(
+            *(self.get_log(task.log.id) for task in failed_tasks)
+        )
+
+        logs: Dict[str, List[str]] = {}
+        metadata: Dict[str, Any] = {}
+        for task, task_log in zip(failed_tasks, tasks_logs):
+            logs[task.name] = task_log
+            metadata[task.name] = get_task_metadata(index, task)
+            if self.classifier is not None:
+                metadata[task.name]["categories"] = self.classifier.classify(task_log)
+        return logs, metadata
+
+    async def get_previous_builds(self) -> Any:
+        """Return the id of the build that ran before the current one
+        on the same definition and branch
+
+        Returns:
+            Any: id of the previous build, None if there is none
+        """
+        build = await self.get_build()
+        max_time = build.start_time or build.queue_time
+        data = await self._get(
+            "builds",
+            definitions=build.definition.id,
+            branchName=build.source_branch,
+            queryOrder="startTimeDescending",
+            maxTime=max_time.isoformat() if max_time else None,
+            **{"$top": 2},
+        )
+        list_builds = [past_build["id"] for past_build in data["value"]]
+        logger.info("List of builds %s", list_builds)
+        return next((b for b in list_builds if b != build.id), None)
+
+    async def failed_jobs(self, build_id: Optional[str] = None) -> Any:
+        """Get list of failed jobs during the pipeline execution.
+
+        Args:
+            build_id (Optional[str], optional): build_id of an azure pipeline. If None, current build_id will be used
+
+        Returns:
+            Any: list of error jobs/stages names during the pipeline execution
+        """
+        timeline = await self.get_timeline(build_id)
+        return group_failed_jobs(TimelineIndex.from_timeline(timeline))
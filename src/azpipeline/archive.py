@@ -0,0 +1,134 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+from azpipeline.libs.utils import atomic_open, write_json
+
+if TYPE_CHECKING:
+    import zstandard
+else:
+    try:
+        import zstandard
+    except ImportError:  # pragma: no cover
+        zstandard = None
+
+logger = logging.getLogger(__name__)
+
+_SUFFIXES = {"gzip": ".log.gz", "zstd": ".log.zst"}
+
+
+class LogArchive:
+    """Compressed, content-addressed archive of task logs.
+
+    Each log is stored once under objects/, compressed and named after the sha256 of
+    its content, so identical logs of different builds (e.g. the same task failing the
+    same way in many builds) share the same file. builds/<build_id>.json maps the task
+    names of a build to the digests of their logs.
+    """
+
+    def __init__(self, directory: Union[str, Path], compression: str = "gzip") -> None:
+        if compression not in _SUFFIXES:
+            raise ValueError(f"Unsupported compression: {compression}")
+        if compression == "zstd" and zstandard is None:
+            raise ImportError(
+                "zstd compression requires zstandard. Install it with: pip install azpipeline[zstd]"
+            )
+        self.directory = Path(directory)
+        self.compression = compression
+
+    @staticmethod
+    def digest(lines: List[str]) -> str:
+        """Content address of a log"""
+        return hashlib.sha256(_encode(lines)).hexdigest()
+
+    def object_path(self, digest: str) -> Path:
+        """Path of the file of a log, objects are spread over 256 folders"""
+        return (
+            self.directory
+            / "objects"
+            / digest[:2]
+            / f"{digest}{_SUFFIXES[self.compression]}"
+        )
+
+    def put(self, lines: List[str]) -> str:
+        """Store a log, unless the same log is already stored
+
+        Returns:
+            str: digest of the log
+        """
+        data = _encode(lines)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.object_path(digest)
+        if path.exists():
+            logger.debug("Log %s is already archived", digest)
+            return digest
+
+        with atomic_open(path) as file:
+            file.write(self._compress(data))
+        return digest
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        """Get the lines of a stored log, None if it is not stored"""
+        try:
+            data = self.object_path(digest).read_bytes()
+        except FileNotFoundError:
+            return None
+        return self._decompress(data).decode("utf-8").split("\n")[:-1]
+
+    def add_build(self, build_id: Any, logs: Dict[str, List[str]]) -> Dict[str, str]:
+        """Store the logs of the tasks of a build and add them to the index of the build
+
+        Args:
+            build_id (Any): build the logs belong to
+            logs (Dict[str, List[str]]): lines of the logs by task name
+
+        Returns:
+            Dict[str, str]: index of the build, digest of the log by task name
+        """
+        index = self.get_index(build_id)
+        for task_name, lines in logs.items():
+            index[task_name] = self.put(lines)
+        write_json(self._index_path(build_id), index)
+        logger.info("Archived %s logs of build %s", len(logs), build_id)
+        return index
+
+    def get_index(self, build_id: Any) -> Dict[str, str]:
+        """Get the digest of the archived logs of a build by task name"""
+        try:
+            return json.loads(self._index_path(build_id).read_text())  # type: ignore
+        except FileNotFoundError:
+            return {}
+
+    def get_build_logs(self, build_id: Any) -> Dict[str, List[str]]:
+        """Get the archived logs of a build by task name"""
+        logs = {}
+        for task_name, digest in self.get_index(build_id).items():
+            lines = self.get(digest)
+            if lines is not None:
+                logs[task_name] = lines
+        return logs
+
+    def _index_path(self, build_id: Any) -> Path:
+        return self.directory / "builds" / f"{build_id}.json"
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdCompressor().compress(data)
+        return gzip.compress(data)
+
+    def _decompress(self, data: bytes) -> bytes:
+        if self.compression == "zstd":
+            return zstandard.ZstdDecompressor().decompress(data)
+        return gzip.decompress(data)
+
+
+def _encode(lines: List[str]) -> bytes:
+    """Encode a log as newline terminated lines, like the disk cache"""
+    return "".join(f"{line}\n" for line in lines).encode("utf-8")
@@ -0,0 +1,313 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from azpipeline.libs.log_file import LogFile, get_index_path
+from azpipeline.timeline import is_timeline_complete
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[Any, ...]
+
+
+def _slugify(value: Any) -> str:
+    """Turn a key part (e.g. an organization url) into a safe file name"""
+    slug = re.sub(r"[^A-Za-z0-9._-]+", "_", str(value)).strip("._")
+    return slug or "_"
+
+
+class DiskCache:
+    """Size bounded cache of immutable build data (timelines and logs) on disk.
+
+    Entries are files under directory, keyed by (organization, project, build_id, name).
+    Reading an entry marks it as recently used (its access time is updated), and
+    the least recently used entries are removed when the cache grows over max_size bytes,
+    down to low_water * max_size bytes so the cache directory is only scanned once in a while.
+    Only immutable data (e.g. from completed builds) should be stored, entries never expire.
+    The line index of the logs opened with open_lines (<entry>.idx) counts in the cache size
+    and is evicted together with its log.
+    """
+
+    low_water = 0.8
+
+    def __init__(self, directory: Union[str, Path], max_size: int = 1 << 30) -> None:
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path(self, key: CacheKey) -> Path:
+        """Get the path of the file of an entry"""
+        return self.directory.joinpath(*(_slugify(part) for part in key))
+
+    def get_bytes(self, key: CacheKey) -> Optional[bytes]:
+        """Get an entry, None if it is not cached"""
+        path = self.path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            logger.debug("Disk cache miss: %s", path)
+            return None
+        self._touch(path)
+        logger.debug("Disk cache hit: %s", path)
+        return data
+
+    def put_bytes(self, key: CacheKey, data: bytes) -> Path:
+        """Store an entry, replacing it if it already exists"""
+        path = self.path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            previous_size = path.stat().st_size if path.exists() else 0
+            # Write to a temporary file first, so readers never see partial entries
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+            self._add_size(len(data) - previous_size)
+        return path
+
+    def get_lines(self, key: CacheKey) -> Optional[List[str]]:
+        """Get an entry stored with put_lines"""
+        data = self.get_bytes(key)
+        if data is None:
+            return None
+        return data.decode("utf-8").split("\n")[:-1]
+
+    def put_lines(self, key: CacheKey, lines: List[str]) -> Path:
+        """Store lines of text (e.g. a log) as a plain text file, one line per line"""
+        return self.put_bytes(key, "".join(f"{line}\n" for line in lines).encode())
+
+    def open_lines(self, key: CacheKey) -> Optional[LogFile]:
+        """Open an entry stored with put_lines for random access to its lines
+        (memory mapped, with a sidecar line index), None if it is not cached"""
+        path = self.path(key)
+        index_path = get_index_path(path)
+        try:
+            try:
+                previous_index_size = index_path.stat().st_size
+            except FileNotFoundError:
+                previous_index_size = 0
+            log_file = LogFile(path)
+        except FileNotFoundError:
+            logger.debug("Disk cache miss: %s", path)
+            return None
+        self._touch(path)
+        logger.debug("Disk cache hit: %s", path)
+        # The line index is (re)built on first use
+        index_size = log_file.index_size
+        if index_size != previous_index_size:
+            with self._lock:
+                self._add_size(index_size - previous_index_size)
+        return log_file
+
+    def get_json(self, key: CacheKey) -> Optional[Any]:
+        """Get an entry stored with put_json"""
+        data = self.get_bytes(key)
+        return None if data is None else json.loads(data)
+
+    def put_json(self, key: CacheKey, obj: Any) -> Path:
+        """Store a json serializable object"""
+        return self.put_bytes(key, json.dumps(obj).encode())
+
+    def size(self) -> int:
+        """Total size in bytes of the cached entries"""
+        if self._size is None:
+            self._size = sum(path.stat().st_size for path in self._entries())
+        return self._size
+
+    def clear(self) -> None:
+        """Remove all the entries"""
+        with self._lock:
+            for path in self._entries():
+                path.unlink()
+            self._size = 0
+
+    def _add_size(self, delta: int) -> None:
+        """Account for delta bytes written to the cache, evicting entries if it gets too big.
+        Must be called with the lock held"""
+        if self._size is None:
+            # Scanning the directory already counts the written bytes
+            self._size = self.size()
+        else:
+            self._size += delta
+        if self._size > self.max_size:
+            self._evict()
+
+    @staticmethod
+    def _touch(path: Path) -> None:
+        """Mark an entry as recently used. The access time is used rather than the
+        modification time, which tells the line index whether the log has changed"""
+        try:
+            os.utime(path, ns=(time.time_ns(), path.stat().st_mtime_ns))
+        except FileNotFoundError:
+            # Evicted by another thread or process since it was read
+            pass
+
+    def _entries(self) -> List[Path]:
+        if not self.directory.exists():
+            return []
+        # Temporary files (of entries and line indexes being written) start with a dot
+        return [
+            path
+            for path in self.directory.rglob("*")
+            if path.is_file() and not path.name.startswith(".")
+        ]
+
+    def _evict(self) -> None:
+        """Remove the least recently used entries until the cache is under its low water mark"""
+        # Line indexes are grouped with their log
+        groups: Dict[Path, List[Tuple[os.stat_result, Path]]] = {}
+        for path in self._entries():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Removed by another process sharing the cache directory
+                continue
+            owner = path.with_suffix("") if path.suffix == ".idx" else path
+            groups.setdefault(owner, []).append((stat, path))
+
+        def last_used(owner: Path) -> int:
+            # Indexes without their log go first
+            return max(
+                (stat.st_atime_ns for stat, path in groups[owner] if path == owner),
+                default=0,
+            )
+
+        size = sum(stat.st_size for group in groups.values() for stat, _ in group)
+        target_size = self.max_size * self.low_water
+        for owner in sorted(groups, key=last_used):
+            if size <= target_size:
+                break
+            for stat, path in groups[owner]:
+                logger.debug("Evicting %s from the disk cache", path)
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+                size -= stat.st_size
+        self._size = size
+
+
+class MemoryCache:
+    """In-process cache with LRU eviction and per entry time to live.
+
+    At most max_entries entries are kept, the least recently used ones are evicted first.
+    Entries stored with ttl=None never expire. The hits and misses counters can be used
+    to monitor the cache efficiency.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: float = 10.0) -> None:
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Get a value, default if it is not cached or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        """Store a value for ttl seconds (forever if ttl is None)"""
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """Remove all the entries and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def _hashable(value: Any) -> Any:
+    """Make a call argument hashable so it can be part of a cache key"""
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_hashable(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _hashable(v)) for k, v in value.items()))
+    return value
+
+
+def _build_ttl(build: Any, ttl: float) -> Optional[float]:
+    """Completed builds don't change anymore and can be cached forever"""
+    return None if build is not None and build.status == "completed" else ttl
+
+
+def _timeline_ttl(timeline: Any, ttl: float) -> Optional[float]:
+    """Timelines where all records are completed don't change anymore"""
+    return None if timeline is not None and is_timeline_complete(timeline) else ttl
+
+
+def _builds_ttl(builds: Any, ttl: float) -> Optional[float]:
+    """Lists of builds can always get new builds"""
+    return ttl
+
+
+class CachedBuildClient:
+    """Wrapper of a BuildClient that caches the results of the build, timeline and build list calls.
+
+    Completed builds and timelines are kept until evicted, anything that can still change
+    (running builds, lists of builds) is cached for cache.ttl seconds.
+    All the other attributes and methods are forwarded to the wrapped client.
+    """
+
+    _ttl_policies: Dict[str, Callable[[Any, float], Optional[float]]] = {
+        "get_build": _build_ttl,
+        "get_build_timeline": _timeline_ttl,
+        "get_builds": _builds_ttl,
+    }
+
+    def __init__(self, build_client: Any, cache: MemoryCache) -> None:
+        self._build_client = build_client
+        self.cache = cache
+        # Clients of different organizations can share the same cache
+        self._key_prefix = getattr(build_client, "normalized_url", None) or id(
+            build_client
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        attribute = getattr(self._build_client, name)
+        if name not in self._ttl_policies:
+            return attribute
+
+        def cached_call(*args: Any, **kwargs: Any) -> Any:
+            key = (self._key_prefix, name, _hashable(args), _hashable(kwargs))
+            missing = object()
+            value = self.cache.get(key, missing)
+            if value is missing:
+                value = attribute(*args, **kwargs)
+                ttl = self._ttl_policies[name](value, self.cache.ttl)
+                self.cache.set(key, value, ttl=ttl)
+            return value
+
+        return cached_call
@@ -0,0 +1,93 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import logging
+import re
+from typing import Dict, Iterable, List, Mapping, Optional, Pattern, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+Patterns = Union[str, Pattern, Iterable[Union[str, Pattern]]]
+
+
+class ErrorClassifier:
+    """Tag logs with the categories of the known errors they contain.
+
+    All the patterns are compiled into a single alternation that prefilters the lines:
+    most log lines match no known error and are rejected by one regex search, the
+    patterns are only tried one by one on the lines that matched the alternation.
+    Patterns shouldn't use numbered backreferences, their numbers change in the alternation.
+    """
+
+    def __init__(self, patterns: Mapping[str, Patterns], flags: int = 0) -> None:
+        """
+        Args:
+            patterns (Mapping[str, Patterns]): regexes (one or several) of the known errors by category
+            flags (int, optional): re flags of the patterns given as strings (e.g. re.IGNORECASE)
+        """
+        self.patterns: List[Tuple[str, Pattern]] = []
+        for category, category_patterns in patterns.items():
+            if isinstance(category_patterns, (str, re.Pattern)):
+                category_patterns = [category_patterns]
+            for pattern in category_patterns:
+                if isinstance(pattern, str):
+                    pattern = re.compile(pattern, flags)
+                self.patterns.append((category, pattern))
+        self.categories: List[str] = list(dict.fromkeys(c for c, _ in self.patterns))
+
+        self._prefilter: Optional[Pattern] = None
+        if self.patterns:
+            alternation = "|".join(
+                f"(?{_scoped_flags(pattern)}:{pattern.pattern})"
+                for _, pattern in self.patterns
+            )
+            try:
+                self._prefilter = re.compile(alternation)
+            except re.error as error:
+                # e.g. the same group name in several patterns, or global inline flags
+                logger.warning("Known errors can't be prefiltered: %s", error)
+
+    def match_line(self, line: str) -> List[str]:
+        """Get the categories of the known errors in a line"""
+        if self._prefilter is not None and not self._prefilter.search(line):
+            return []
+        return list(
+            dict.fromkeys(c for c, pattern in self.patterns if pattern.search(line))
+        )
+
+    def classify(self, lines: Iterable[str]) -> List[str]:
+        """Get the categories of the known errors in a log, scanned line by line
+        (lines can be streamed, e.g. from AzurePipeline.iter_log_lines)
+
+        Returns:
+            List[str]: categories found, in the order of the patterns
+        """
+        found: Dict[str, None] = {}
+        remaining = list(self.patterns)
+        for line in lines:
+            if not remaining:
+                break
+            if self._prefilter is not None and not self._prefilter.search(line):
+                continue
+            for category, pattern in remaining:
+                if pattern.search(line):
+                    found[category] = None
+            # Categories already found don't need to be searched anymore
+            remaining = [(c, p) for c, p in remaining if c not in found]
+        return [category for category in self.categories if category in found]
+
+
+def _scoped_flags(pattern: Pattern) -> str:
+    """Flags of a compiled pattern, for a scoped group so they only apply to the pattern"""
+    return "".join(
+        letter
+        for flag, letter in (
+            (re.A, "a"),
+            (re.I, "i"),
+            (re.M, "m"),
+            (re.S, "s"),
+            (re.X, "x"),
+        )
+        if pattern.flags & flag
+    )
@@ -0,0 +1,145 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+from datetime import timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+from msrest import Deserializer
+
+if TYPE_CHECKING:
+    import numpy as np
+else:
+    try:
+        import numpy as np
+    except ImportError:  # pragma: no cover
+        np = None
+
+
+def _to_datetime64(value: Any) -> Any:
+    """Convert a record date (datetime, iso string in raw mode, or None) to a UTC datetime64"""
+    if value is None:
+        return np.datetime64("NaT", "ms")
+    if isinstance(value, str):
+        value = Deserializer.deserialize_iso(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(value, "ms")
+
+
+def _encode(values: List[Any]) -> Tuple["np.ndarray", List[Any]]:
+    """Encode values as categorical codes, returns the codes and the categories"""
+    categories: Dict[Any, int] = {}
+    codes = [categories.setdefault(value, len(categories)) for value in values]
+    return np.asarray(codes, dtype=np.int16), list(categories)
+
+
+class TimelineTable:
+    """Columnar representation of a timeline, backed by numpy arrays.
+
+    type, result and state are categorical codes (see types, results and states for
+    the categories), start and finish are datetime64 arrays (NaT when missing) and
+    parent holds the row index of the parent record (-1 for root records).
+    Queries are vectorized boolean masks instead of loops over timeline.records.
+    """
+
+    def __init__(self, records: Sequence[Any]) -> None:
+        if np is None:
+            raise ImportError(
+                "TimelineTable requires numpy. Install it with: pip install azpipeline[columnar]"
+            )
+
+        self.records: Tuple[Any, ...] = tuple(records)
+        self.ids = np.asarray([record.id for record in self.records], dtype=object)
+        self.names = np.asarray([record.name for record in self.records], dtype=object)
+        self.type, self.types = _encode([record.type for record in self.records])
+        self.result, self.results = _encode([record.result for record in self.records])
+        self.state, self.states = _encode([record.state for record in self.records])
+        self.start = np.asarray(
+            [_to_datetime64(record.start_time) for record in self.records],
+            dtype="datetime64[ms]",
+        )
+        self.finish = np.asarray(
+            [_to_datetime64(record.finish_time) for record in self.records],
+            dtype="datetime64[ms]",
+        )
+
+        positions = {record.id: i for i, record in enumerate(self.records)}
+        self.parent = np.asarray(
+            [positions.get(record.parent_id, -1) for record in self.records],
+            dtype=np.int32,
+        )
+
+    @classmethod
+    def from_timeline(cls, timeline: Any) -> "TimelineTable":
+        """Build the table of a timeline (Timeline, raw JsonView or CompactTimeline)"""
+        return cls(timeline.records or [])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def _equals(self, codes: "np.ndarray", categories: List[Any], value: Any) -> Any:
+        if value not in categories:
+            return np.zeros(len(self), dtype=bool)
+        return codes == categories.index(value)
+
+    def mask(
+        self,
+        record_type: Optional[str] = None,
+        result: Optional[str] = None,
+        state: Optional[str] = None,
+    ) -> "np.ndarray":
+        """Boolean mask of the records matching the given type, result and state"""
+        selected = np.ones(len(self), dtype=bool)
+        if record_type is not None:
+            selected &= self._equals(self.type, self.types, record_type)
+        if result is not None:
+            selected &= self._equals(self.result, self.results, result)
+        if state is not None:
+            selected &= self._equals(self.state, self.states, state)
+        return selected
+
+    def select(self, mask: "np.ndarray") -> List[Any]:
+        """Get the records selected by a mask, in timeline order"""
+        return [self.records[i] for i in np.flatnonzero(mask)]
+
+    def failed_tasks(self) -> List[Any]:
+        """Failed tasks, like AzurePipeline.get_failed_tasks"""
+        return self.select(self.mask("Task", "failed"))
+
+    def failed_jobs(self) -> List[str]:
+        """Sorted names of the failed jobs"""
+        return sorted(set(self.names[self.mask("Job", "failed")]))
+
+    def failed_tasks_parents(self) -> "np.ndarray":
+        """Row index of the parent of each failed task (-1 if it has none)"""
+        parents: np.ndarray = self.parent[self.mask("Task", "failed")]
+        return parents
+
+    def durations(self) -> "np.ndarray":
+        """Duration of each record in seconds (NaN if the record didn't start or finish)"""
+        durations = (self.finish - self.start).astype("timedelta64[ms]")
+        seconds: np.ndarray = durations.astype(np.float64) / 1000
+        seconds[np.isnat(durations)] = np.nan
+        return seconds
+
+    def duration_stats(
+        self, record_type: Optional[str] = None, result: Optional[str] = None
+    ) -> Dict[str, float]:
+        """Statistics (in seconds) of the durations of the records of a type and result
+
+        Returns:
+            Dict[str, float]: count, total, mean, median, p95 and max durations
+        """
+        durations = self.durations()[self.mask(record_type, result)]
+        durations = durations[~np.isnan(durations)]
+        if not len(durations):
+            return {"count": 0}
+        return {
+            "count": int(len(durations)),
+            "total": float(durations.sum()),
+            "mean": float(durations.mean()),
+            "median": float(np.median(durations)),
+            "p95": float(np.percentile(durations, 95)),
+            "max": float(durations.max()),
+        }
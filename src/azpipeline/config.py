@@ -8,3 +8,4 @@ from pathlib import Path
 class Config:
     cwd = Path.cwd()
     ADO_LOGS_DIR = cwd / "logs"
+    ADO_CACHE_DIR = ADO_LOGS_DIR / "cache"
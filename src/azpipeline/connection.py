@@ -0,0 +1,95 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Tuple
+
+from azure.devops.connection import Connection
+from azure.devops.released.build import BuildClient
+from msrest.authentication import BasicAuthentication
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Process-wide registry of azure devops connections.
+
+    Connections and build clients are keyed by (organization_url, token), so all
+    the pipelines of the same organization share one build client. This means one
+    resource area discovery, and http sessions with keep-alive connection pools
+    that are reused (msrest keeps one requests session per thread and client).
+    """
+
+    def __init__(self, pool_connections: int = 10, pool_maxsize: int = 10) -> None:
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self._lock = threading.Lock()
+        self._connections: Dict[Tuple[str, str], Connection] = {}
+        self._build_clients: Dict[Tuple[str, str], BuildClient] = {}
+        self._pooled_sessions: Any = weakref.WeakSet()
+
+    def configure(self, pool_connections: int, pool_maxsize: int) -> None:
+        """Set the size of the http connection pools of the sessions created from now on
+
+        Args:
+            pool_connections (int): number of hosts to keep connection pools for
+            pool_maxsize (int): maximum number of connections kept alive per host
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+    def get_connection(self, organization_url: str, token: str) -> Connection:
+        """Get the shared connection to an azure devops organization"""
+        key = (organization_url, token)
+        with self._lock:
+            if key not in self._connections:
+                logger.debug("Creating connection to %s", organization_url)
+                self._connections[key] = Connection(
+                    base_url=organization_url, creds=BasicAuthentication("", token)
+                )
+            return self._connections[key]
+
+    def get_build_client(self, organization_url: str, token: str) -> BuildClient:
+        """Get the shared build client of an azure devops organization"""
+        key = (organization_url, token)
+        connection = self.get_connection(organization_url, token)
+        with self._lock:
+            if key not in self._build_clients:
+                build_client = connection.clients.get_build_client()
+                build_client.config.keep_alive = True
+                build_client.config.session_configuration_callback = (
+                    self._configure_session
+                )
+                self._build_clients[key] = build_client
+            return self._build_clients[key]
+
+    def clear(self) -> None:
+        """Forget all the shared connections and clients"""
+        with self._lock:
+            self._connections.clear()
+            self._build_clients.clear()
+
+    def _configure_session(
+        self, session: Any, global_config: Any, local_config: Any, **kwargs: Any
+    ) -> Any:
+        """msrest session callback: mount pooled http adapters once per session"""
+        if session not in self._pooled_sessions:
+            for protocol in ("http://", "https://"):
+                session.mount(
+                    protocol,
+                    HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize,
+                        max_retries=session.get_adapter(protocol).max_retries,
+                    ),
+                )
+            self._pooled_sessions.add(session)
+        return kwargs
+
+
+# Registry shared by all the AzurePipeline instances of the process
+connection_pool = ConnectionPool()
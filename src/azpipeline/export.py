@@ -0,0 +1,158 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import logging
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from msrest import Deserializer
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = None
+    pq = None
+
+logger = logging.getLogger(__name__)
+
+PARTITION_COLUMNS = ["definition", "branch"]
+
+
+if pa is not None:
+    _TIMELINE_SCHEMA = pa.schema(
+        [
+            ("build_id", pa.int64()),
+            ("definition", pa.string()),
+            ("branch", pa.string()),
+            ("record_id", pa.string()),
+            ("parent_id", pa.string()),
+            ("type", pa.string()),
+            ("name", pa.string()),
+            ("result", pa.string()),
+            ("state", pa.string()),
+            ("start_time", pa.timestamp("ms", tz="UTC")),
+            ("finish_time", pa.timestamp("ms", tz="UTC")),
+            ("order", pa.int32()),
+            ("log_id", pa.int64()),
+            ("worker_name", pa.string()),
+            ("issues", pa.list_(pa.string())),
+        ]
+    )
+    _BUILDS_SCHEMA = pa.schema(
+        [
+            ("build_id", pa.int64()),
+            ("definition", pa.string()),
+            ("branch", pa.string()),
+            ("build_number", pa.string()),
+            ("status", pa.string()),
+            ("result", pa.string()),
+            ("queue_time", pa.timestamp("ms", tz="UTC")),
+            ("start_time", pa.timestamp("ms", tz="UTC")),
+            ("finish_time", pa.timestamp("ms", tz="UTC")),
+            ("source_version", pa.string()),
+            ("requested_for", pa.string()),
+        ]
+    )
+
+
+def _to_datetime(value: Any) -> Optional[datetime]:
+    """Convert a date (datetime or iso string in raw mode) to an UTC datetime"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = Deserializer.deserialize_iso(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)  # type: ignore
+    return value.astimezone(timezone.utc)  # type: ignore
+
+
+class ParquetExporter:
+    """Export timelines and build history to partitioned Parquet datasets.
+
+    Timelines are appended to <root>/timelines and builds to <root>/builds, both
+    partitioned by definition and branch (hive style). Each build is written to its
+    own files, so exporting a build again replaces its previous export.
+    The datasets can then be queried with pyarrow, duckdb, polars, spark...
+    """
+
+    def __init__(self, root: Union[str, Path]) -> None:
+        if pa is None:
+            raise ImportError(
+                "ParquetExporter requires pyarrow. Install it with: pip install azpipeline[parquet]"
+            )
+        self.root = Path(root)
+        self.timelines_dir = self.root / "timelines"
+        self.builds_dir = self.root / "builds"
+
+    def timeline_table(self, timeline: Any, build: Any) -> "pa.Table":
+        """Convert a timeline to an arrow table, one row per record"""
+        rows: Dict[str, List[Any]] = {name: [] for name in _TIMELINE_SCHEMA.names}
+        for record in timeline.records or []:
+            rows["build_id"].append(int(build.id))
+            rows["definition"].append(build.definition.name)
+            rows["branch"].append(build.source_branch)
+            rows["record_id"].append(record.id)
+            rows["parent_id"].append(record.parent_id)
+            rows["type"].append(record.type)
+            rows["name"].append(record.name)
+            rows["result"].append(record.result)
+            rows["state"].append(record.state)
+            rows["start_time"].append(_to_datetime(record.start_time))
+            rows["finish_time"].append(_to_datetime(record.finish_time))
+            rows["order"].append(record.order)
+            rows["log_id"].append(record.log.id if record.log else None)
+            rows["worker_name"].append(record.worker_name)
+            rows["issues"].append([issue.message for issue in record.issues or []])
+        return pa.Table.from_pydict(rows, schema=_TIMELINE_SCHEMA)
+
+    def builds_table(self, builds: Iterable[Any]) -> "pa.Table":
+        """Convert builds to an arrow table, one row per build"""
+        rows: Dict[str, List[Any]] = {name: [] for name in _BUILDS_SCHEMA.names}
+        for build in builds:
+            rows["build_id"].append(int(build.id))
+            rows["definition"].append(build.definition.name)
+            rows["branch"].append(build.source_branch)
+            rows["build_number"].append(build.build_number)
+            rows["status"].append(build.status)
+            rows["result"].append(build.result)
+            rows["queue_time"].append(_to_datetime(build.queue_time))
+            rows["start_time"].append(_to_datetime(build.start_time))
+            rows["finish_time"].append(_to_datetime(build.finish_time))
+            rows["source_version"].append(build.source_version)
+            rows["requested_for"].append(
+                build.requested_for.display_name if build.requested_for else None
+            )
+        return pa.Table.from_pydict(rows, schema=_BUILDS_SCHEMA)
+
+    def append_timeline(self, timeline: Any, build: Any) -> None:
+        """Append the timeline of a build to the timelines dataset
+
+        Args:
+            timeline (Any): timeline of the build (Timeline, raw JsonView or CompactTimeline)
+            build (Any): the build, for the build_id, definition and branch columns
+        """
+        logger.info(
+            "Exporting timeline of build %s to %s", build.id, self.timelines_dir
+        )
+        self._write(self.timeline_table(timeline, build), self.timelines_dir, build.id)
+
+    def append_builds(self, builds: Iterable[Any]) -> None:
+        """Append builds (e.g. from AzurePipeline.iter_previous_builds) to the builds dataset"""
+        table = self.builds_table(builds)
+        if table.num_rows:
+            logger.info("Exporting %s builds to %s", table.num_rows, self.builds_dir)
+            first, last = table["build_id"][0], table["build_id"][-1]
+            self._write(table, self.builds_dir, f"{first}-{last}")
+
+    @staticmethod
+    def _write(table: "pa.Table", directory: Path, name: Any) -> None:
+        pq.write_to_dataset(
+            table,
+            root_path=str(directory),
+            partition_cols=PARTITION_COLUMNS,
+            basename_template=f"{name}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+        )
@@ -0,0 +1,182 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+import mmap
+import os
+import re
+import struct
+from array import array
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Pattern, Tuple, Union, overload
+
+from azpipeline.libs.utils import atomic_open
+
+# The index starts with a magic number, the size and the modification time (ns) of the
+# indexed log, followed by the offsets of the start of each line and the end of the log
+_INDEX_HEADER = struct.Struct("<4sQQ")
+_INDEX_MAGIC = b"AZLI"
+
+# Number of lines decoded at once by grep
+_GREP_CHUNK_LINES = 4096
+
+
+def get_index_path(path: Union[str, Path]) -> Path:
+    """Path of the sidecar line index of a log file"""
+    path = Path(path)
+    return path.with_name(f"{path.name}.idx")
+
+
+def build_line_index(path: Union[str, Path]) -> Path:
+    """Write the sidecar line index of a log file (newline terminated lines)
+
+    Returns:
+        Path: path of the index
+    """
+    path = Path(path)
+    index_path = get_index_path(path)
+    stat = path.stat()
+    size = stat.st_size
+    with atomic_open(index_path) as index_file:
+        index_file.write(_INDEX_HEADER.pack(_INDEX_MAGIC, size, stat.st_mtime_ns))
+        offsets = array("Q", [0])
+        if size:
+            with path.open("rb") as file, mmap.mmap(
+                file.fileno(), 0, access=mmap.ACCESS_READ
+            ) as data:
+                position = data.find(b"\n")
+                while position != -1:
+                    offsets.append(position + 1)
+                    if len(offsets) >= 1 << 16:
+                        index_file.write(offsets.tobytes())
+                        del offsets[:]
+                    position = data.find(b"\n", position + 1)
+                # The last line is not newline terminated
+                if data[size - 1] != ord("\n"):
+                    offsets.append(size)
+        index_file.write(offsets.tobytes())
+    return index_path
+
+
+class LogFile:
+    """Random access to the lines of a log file, without reading the whole file.
+
+    The log and its sidecar line index (<log>.idx, built on first use) are memory
+    mapped: log[i] and log[a:b] only read the bytes of the requested lines, and grep
+    decodes the lines by chunks. Lines are numbered from 0 like a list.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._file = self.path.open("rb")
+        self._data: Any = b""
+        try:
+            stat = os.fstat(self._file.fileno())
+            if stat.st_size:
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            index_path = get_index_path(self.path)
+            if not self._is_index_valid(index_path, stat):
+                build_line_index(self.path)
+            with index_path.open("rb") as index_file:
+                self._index = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            # e.g. the log or its index was removed by another process
+            self._close_data()
+            raise
+        header_size = _INDEX_HEADER.size
+        self._offsets = memoryview(self._index)[header_size:].cast("Q")
+
+    @staticmethod
+    def _is_index_valid(index_path: Path, stat: os.stat_result) -> bool:
+        try:
+            with index_path.open("rb") as index_file:
+                header = index_file.read(_INDEX_HEADER.size)
+        except FileNotFoundError:
+            return False
+        return len(header) == _INDEX_HEADER.size and _INDEX_HEADER.unpack(header) == (
+            _INDEX_MAGIC,
+            stat.st_size,
+            stat.st_mtime_ns,
+        )
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @overload
+    def __getitem__(self, item: int) -> str:
+        ...
+
+    @overload
+    def __getitem__(self, item: slice) -> List[str]:
+        ...
+
+    def __getitem__(self, item: Union[int, slice]) -> Union[str, List[str]]:
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._read_lines(start, stop)
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("log line index out of range")
+        return self._read_lines(item, item + 1)[0]
+
+    def _read_lines(self, start: int, stop: int) -> List[str]:
+        """Read the lines start to stop (excluded) with a single read"""
+        if start >= stop:
+            return []
+        begin, end = self._offsets[start], self._offsets[stop]
+        data = self._data[begin:end]
+        lines: List[str] = data.decode("utf-8", errors="replace").split("\n")
+        return lines[: stop - start]
+
+    def tail(self, n: int = 100) -> List[str]:
+        """Last n lines of the log"""
+        first_line = max(len(self) - n, 0)
+        return self[first_line:] if n > 0 else []
+
+    def grep(
+        self, pattern: Union[str, Pattern[str]], max_hits: Optional[int] = None
+    ) -> Iterator[Tuple[int, str]]:
+        """Iterate over the lines matching a regex. The lines are read by chunks out of
+        the memory mapped log and searched one by one, like lines read from the api
+
+        Args:
+            pattern (Union[str, Pattern[str]]): regex searched in each line
+            max_hits (Optional[int], optional): stop after max_hits matching lines
+
+        Yields:
+            Iterator[Tuple[int, str]]: number (from 0) and content of the matching lines
+        """
+        regex = re.compile(pattern) if isinstance(pattern, str) else pattern
+        hits = 0
+        for start in range(0, len(self), _GREP_CHUNK_LINES):
+            lines = self._read_lines(start, min(start + _GREP_CHUNK_LINES, len(self)))
+            for line_number, line in enumerate(lines, start):
+                if max_hits is not None and hits >= max_hits:
+                    return
+                if regex.search(line):
+                    hits += 1
+                    yield line_number, line
+
+    @property
+    def index_size(self) -> int:
+        """Size in bytes of the line index"""
+        return len(self._index)
+
+    def close(self) -> None:
+        self._offsets.release()
+        self._index.close()
+        self._close_data()
+
+    def _close_data(self) -> None:
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self) -> "LogFile":
+        return self
+
+    def __exit__(self, *exc_details: Any) -> None:
+        self.close()
@@ -0,0 +1,126 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+import io
+import re
+import tempfile
+import zipfile
+from collections import defaultdict
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+# Member names in the logs zip look like "<stage name>/<job name>/<task order>_<task name>.txt"
+# (older zips have no stage folder)
+_MEMBER_PATTERN = re.compile(r"^(?P<order>\d+)_(?P<name>.*)\.txt$")
+
+# Folders, task order and task name, normalized
+ZipLogKey = Tuple[Tuple[str, ...], int, str]
+
+
+def _normalize(name: str) -> str:
+    """Normalize a job/task name, azure devops replaces invalid path characters in the zip"""
+    return re.sub(r"[^0-9a-z]+", "_", name.lower()).strip("_")
+
+
+def get_zip_log_key(
+    folders: Sequence[Optional[str]], order: int, task_name: str
+) -> ZipLogKey:
+    """Key used to match a timeline task with its log file in the logs zip
+
+    Args:
+        folders (Sequence[Optional[str]]): names of the stage and the job of the task (missing names are skipped)
+        order (int): order of the task in its job
+        task_name (str): name of the task
+    """
+    path = tuple(_normalize(name) for name in folders if name)
+    return path, int(order), _normalize(task_name)
+
+
+def parse_zip_log_member(member_name: str) -> Optional[ZipLogKey]:
+    """Get the key of a logs zip member, None if it isn't a task log"""
+    *folders, file_name = member_name.split("/")
+    match = _MEMBER_PATTERN.match(file_name)
+    if not match:
+        return None
+    return get_zip_log_key(folders, int(match["order"]), match["name"])
+
+
+def _match_members(
+    members: Iterable[zipfile.ZipInfo], wanted: Dict[ZipLogKey, Any]
+) -> Dict[str, Any]:
+    """Match the members of a logs zip with the wanted logs.
+
+    A member matches a wanted key with the same folders, or with the same last folders
+    (zips without stage folders). Keys that match several logs or several members are
+    ambiguous: these logs are left out rather than risking returning the wrong log.
+
+    Returns:
+        Dict[str, Any]: keys of the result (values of wanted) by member name
+    """
+    candidates: Dict[ZipLogKey, Set[Any]] = defaultdict(set)
+    for (folders, order, name), value in wanted.items():
+        for first_folder in range(max(len(folders), 1)):
+            candidates[folders[first_folder:], order, name].add(value)
+
+    members_by_key: Dict[ZipLogKey, List[str]] = defaultdict(list)
+    for member in members:
+        key = parse_zip_log_member(member.filename)
+        if key is not None and key in candidates:
+            members_by_key[key].append(member.filename)
+
+    matches: Dict[str, Any] = {}
+    matched_values: Dict[Any, int] = defaultdict(int)
+    for key, member_names in members_by_key.items():
+        if len(member_names) == 1 and len(candidates[key]) == 1:
+            value = next(iter(candidates[key]))
+            matches[member_names[0]] = value
+            matched_values[value] += 1
+    return {
+        member_name: value
+        for member_name, value in matches.items()
+        if matched_values[value] == 1
+    }
+
+
+def _spool(chunks: Iterable[bytes], spool_size: int) -> IO[bytes]:
+    """Write chunks to a seekable file, in memory up to spool_size bytes and then on disk.
+    SpooledTemporaryFile can't be used: it isn't seekable for zipfile before python 3.11
+    """
+    spooled: IO[bytes] = io.BytesIO()
+    for chunk in chunks:
+        if isinstance(spooled, io.BytesIO) and spooled.tell() + len(chunk) > spool_size:
+            file = tempfile.TemporaryFile()
+            file.write(spooled.getvalue())
+            spooled = file
+        spooled.write(chunk)
+    spooled.seek(0)
+    return spooled
+
+
+def extract_zip_logs(
+    chunks: Iterable[bytes],
+    wanted: Dict[ZipLogKey, Any],
+    spool_size: int = 8 << 20,
+) -> Dict[Any, List[str]]:
+    """Extract some logs out of a streamed logs zip.
+
+    The archive is spooled to a temporary file (in memory only up to spool_size bytes)
+    and only the wanted members are decompressed, line by line.
+
+    Args:
+        chunks (Iterable[bytes]): content of the zip, e.g. from BuildClient.get_build_logs_zip
+        wanted (Dict[ZipLogKey, Any]): keys of the members to extract, mapped to the keys of the result.
+            Ambiguous keys (matching several logs or members) are not extracted
+        spool_size (int, optional): size in bytes above which the archive is written to disk
+
+    Returns:
+        Dict[Any, List[str]]: lines of the extracted logs, by the keys given in wanted
+    """
+    logs: Dict[Any, List[str]] = {}
+    with _spool(chunks, spool_size) as archive:
+        with zipfile.ZipFile(archive) as zip_file:
+            matches = _match_members(zip_file.infolist(), wanted)
+            for member_name, value in matches.items():
+                with zip_file.open(member_name) as file:
+                    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+                    logs[value] = [line.rstrip("\r\n") for line in text]
+    return logs
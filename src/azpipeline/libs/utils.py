@@ -1,11 +1,141 @@
 __copyright__ = """
 @copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
 """
+import gzip
+import io
 import json
+import os
+import secrets
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Union
+from typing import (
+    IO,
+    TYPE_CHECKING,
+    Any,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Union,
+)
 
+if TYPE_CHECKING:
+    import zstandard
+else:
+    try:
+        import zstandard
+    except ImportError:  # pragma: no cover
+        zstandard = None
 
-def write_json(output_path: Union[str, Path], obj: dict) -> None:
-    with Path(output_path).open() as file:
-        json.dump(obj, file)
+# File suffix of the JSON Lines files by compression
+JSONL_SUFFIXES = {None: ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+
+def _create_temporary_file(path: Path) -> Tuple[int, Path]:
+    """Create a new file with a random name next to path. Unlike mkstemp (owner only),
+    the file gets the usual permissions, following the current umask"""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp_path = path.with_name(f".{path.name}.tmp-{secrets.token_hex(8)}")
+        try:
+            return os.open(tmp_path, flags, 0o666), tmp_path
+        except FileExistsError:  # pragma: no cover
+            continue
+
+
+@contextmanager
+def atomic_open(output_path: Union[str, Path]) -> Iterator[IO[bytes]]:
+    """Open a temporary file next to output_path, renamed to output_path once written.
+    Readers never see a partially written file, and the file is left untouched on errors
+    """
+    path = Path(output_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = _create_temporary_file(path)
+    try:
+        with os.fdopen(fd, "wb") as file:
+            yield file
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _compressed_writer(file: IO[bytes], compression: Optional[str]) -> IO[bytes]:
+    if compression is None:
+        return file
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=file, mode="wb")  # type: ignore
+    if compression == "zstd":
+        if zstandard is None:
+            raise ImportError(
+                "zstd compression requires zstandard. Install it with: pip install azpipeline[zstd]"
+            )
+        return zstandard.ZstdCompressor().stream_writer(file)
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+def write_json(output_path: Union[str, Path], obj: Any) -> None:
+    """Write an object as json, atomically"""
+    with atomic_open(output_path) as file:
+        with io.TextIOWrapper(file, encoding="utf-8") as text:
+            json.dump(obj, text)
+
+
+def write_jsonl(
+    output_path: Union[str, Path],
+    records: Iterable[Any],
+    compression: Optional[str] = None,
+) -> int:
+    """Stream records to a JSON Lines file, one json object per line, atomically.
+    Records are serialized one at a time, so memory use doesn't grow with the file size
+
+    Args:
+        output_path (Union[str, Path]): path of the file (see JSONL_SUFFIXES for the usual suffixes)
+        records (Iterable[Any]): json serializable records (dates are written as strings)
+        compression (Optional[str], optional): None, "gzip" or "zstd" (requires zstandard)
+
+    Returns:
+        int: number of records written
+    """
+    count = 0
+    with atomic_open(output_path) as file:
+        writer = _compressed_writer(file, compression)
+        try:
+            for record in records:
+                writer.write(json.dumps(record, default=str).encode("utf-8"))
+                writer.write(b"\n")
+                count += 1
+        finally:
+            if writer is not file:
+                writer.close()
+    return count
+
+
+def read_jsonl(input_path: Union[str, Path]) -> Iterator[Any]:
+    """Iterate over the records of a JSON Lines file written with write_jsonl.
+    The compression is detected from the file suffix (.gz or .zst)"""
+    path = Path(input_path)
+    with path.open("rb") as file:
+        reader: IO[bytes] = file
+        if path.suffix == ".gz":
+            reader = gzip.GzipFile(fileobj=file, mode="rb")  # type: ignore
+        elif path.suffix == ".zst":
+            if zstandard is None:
+                raise ImportError(
+                    "zstd compression requires zstandard. Install it with: pip install azpipeline[zstd]"
+                )
+            reader = zstandard.ZstdDecompressor().stream_reader(file)
+        for line in io.TextIOWrapper(reader, encoding="utf-8"):
+            yield json.loads(line)
+
+
+def unwrap_builds(response: Any) -> Tuple[List[Any], Optional[str]]:
+    """Get the builds and the continuation token out of a get_builds response.
+    Depending on the azure-devops version, get_builds returns a list of builds
+    or an object with value and continuation_token attributes"""
+    if response is None:
+        return [], None
+    if hasattr(response, "value"):
+        return list(response.value or []), getattr(response, "continuation_token", None)
+    return list(response), None
@@ -3,7 +3,8 @@ __copyright__ = """
 """
 
 from dataclasses import dataclass
-from typing import Any
+from functools import lru_cache
+from typing import Any, List, NamedTuple, Optional, Tuple
 
 
 @dataclass
@@ -16,3 +17,196 @@ class PipelineSummary:
     branch: Any
     commit_id: Any
     triggered_by: Any
+
+
+@lru_cache(maxsize=None)
+def _camel_case(name: str) -> str:
+    """Convert a snake_case attribute name to the camelCase key used by the azure devops api"""
+    first, *others = name.split("_")
+    return first + "".join(other.capitalize() for other in others)
+
+
+def _wrap(value: Any) -> Any:
+    if isinstance(value, dict):
+        return JsonView(value)
+    if isinstance(value, list):
+        return [_wrap(item) for item in value]
+    return value
+
+
+class JsonView:
+    """Read-only view over a parsed json object returned by the azure devops api.
+
+    Attributes are accessed like on the msrest models (e.g. record.parent_id reads
+    the "parentId" key), without deserializing the whole payload into model objects.
+    Missing keys are None, nested objects are views too. Dates are left as strings.
+    """
+
+    __slots__ = ("_data",)
+
+    def __init__(self, data: dict) -> None:
+        self._data = data
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return _wrap(self._data.get(_camel_case(name)))
+
+    def to_dict(self) -> dict:
+        """Get the underlying json object"""
+        return self._data
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, JsonView) and self._data == other._data
+
+    def __repr__(self) -> str:
+        return f"JsonView({self._data!r})"
+
+
+class CompactIssue(NamedTuple):
+    type: Any
+    message: Any
+
+
+class CompactLog(NamedTuple):
+    id: Any
+
+
+class CompactRecord(NamedTuple):
+    """Immutable and memory efficient (no per instance __dict__) timeline record.
+    Only holds the fields used by azpipeline."""
+
+    id: Any
+    parent_id: Any
+    type: Any
+    name: Any
+    result: Any
+    state: Any
+    start_time: Any
+    finish_time: Any
+    log_id: Any
+    issues: Tuple[CompactIssue, ...]
+    worker_name: Any
+    order: Any
+
+    @classmethod
+    def from_record(cls, record: Any) -> "CompactRecord":
+        """Convert a TimelineRecord (or any object with the same attributes)"""
+        return cls(
+            id=record.id,
+            parent_id=record.parent_id,
+            type=record.type,
+            name=record.name,
+            result=record.result,
+            state=record.state,
+            start_time=record.start_time,
+            finish_time=record.finish_time,
+            log_id=record.log.id if record.log else None,
+            issues=tuple(
+                CompactIssue(type=issue.type, message=issue.message)
+                for issue in record.issues or []
+            ),
+            worker_name=record.worker_name,
+            order=record.order,
+        )
+
+    @property
+    def log(self) -> Optional[CompactLog]:
+        """Log reference, like TimelineRecord.log"""
+        return None if self.log_id is None else CompactLog(self.log_id)
+
+    def to_dict(self) -> dict:
+        record = self._asdict()
+        record["issues"] = [issue._asdict() for issue in self.issues]
+        return record
+
+
+class CompactTimeline(NamedTuple):
+    """Immutable and memory efficient timeline, made of CompactRecord"""
+
+    id: Any
+    change_id: Any
+    records: Tuple[CompactRecord, ...]
+
+    @classmethod
+    def from_timeline(cls, timeline: Any) -> "CompactTimeline":
+        """Convert a Timeline (or any object with the same attributes)"""
+        return cls(
+            id=timeline.id,
+            change_id=timeline.change_id,
+            records=tuple(
+                CompactRecord.from_record(record) for record in timeline.records or []
+            ),
+        )
+
+
+class Failure(NamedTuple):
+    """A failure of a build, identified by a fingerprint that is stable across builds"""
+
+    fingerprint: str
+    stage: Any
+    job: Any
+    task: Any
+    issues: Tuple[str, ...]
+
+
+@dataclass
+class BuildComparison:
+    """Failures of a build compared to the failures of a previous build"""
+
+    prev_build: Any
+    curr_build: Any
+    new: List[Failure]
+    fixed: List[Failure]
+    repeated: List[Failure]
+
+    @property
+    def message(self) -> Optional[str]:
+        """Short feedback message: new failure!, repeated failure, back to normal or None"""
+        if self.new:
+            return "new failure!"
+        if self.repeated:
+            return "new failure!" if self.fixed else "repeated failure"
+        if self.fixed:
+            return "back to normal"
+        return None
+
+
+@dataclass
+class FailureTrend:
+    """History of a failure over a window of builds"""
+
+    failure: Failure
+    # Oldest and newest builds of the window with the failure
+    first_seen: Any
+    last_seen: Any
+    # Build where the current streak started, None if the newest build doesn't have the failure
+    failing_since: Any
+    # Number of consecutive builds, up to the newest one, with the failure
+    streak: int
+    occurrences: int
+    # Rate of fail/pass flips since the failure was first seen, from 0 (stable) to 1
+    flakiness: float
+
+
+@dataclass
+class BisectResult:
+    """Build where a failure first appeared, found by bisecting the build history"""
+
+    fingerprint: str
+    # Oldest build of the current streak of the failure
+    first_failing: Any
+    # Build before first_failing, None if the failure is in the whole searched history
+    last_passing: Any
+    builds_searched: int
+    timelines_fetched: int
+
+
+class LogHit(NamedTuple):
+    """A log line matching a search"""
+
+    build_id: Any
+    task: Any
+    # Line number in the log, from 1
+    line_number: int
+    snippet: str
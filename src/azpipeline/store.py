@@ -0,0 +1,317 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import json
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Union
+
+from msrest import Deserializer
+
+from azpipeline.libs.utils import unwrap_builds
+from azpipeline.timeline import TimelineIndex, get_task_metadata
+
+if TYPE_CHECKING:
+    from azpipeline import AzurePipeline
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS builds (
+    build_id INTEGER PRIMARY KEY,
+    definition_id INTEGER,
+    definition TEXT,
+    branch TEXT,
+    build_number TEXT,
+    status TEXT,
+    result TEXT,
+    queue_time TEXT,
+    start_time TEXT,
+    finish_time TEXT,
+    source_version TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_definition_branch
+    ON builds (definition_id, branch, start_time);
+CREATE INDEX IF NOT EXISTS builds_definition ON builds (definition);
+CREATE INDEX IF NOT EXISTS builds_result ON builds (result);
+CREATE INDEX IF NOT EXISTS builds_finish_time ON builds (finish_time);
+
+CREATE TABLE IF NOT EXISTS timelines (
+    build_id INTEGER PRIMARY KEY REFERENCES builds (build_id),
+    timeline TEXT
+);
+
+CREATE TABLE IF NOT EXISTS failed_tasks (
+    build_id INTEGER REFERENCES builds (build_id),
+    task_id TEXT,
+    name TEXT,
+    parent TEXT,
+    log_id INTEGER,
+    issues TEXT,
+    PRIMARY KEY (build_id, task_id)
+);
+
+CREATE TABLE IF NOT EXISTS sync_state (
+    definition_id INTEGER,
+    branch TEXT,
+    last_finish_time TEXT,
+    PRIMARY KEY (definition_id, branch)
+);
+"""
+
+
+def _to_iso(value: Any) -> Optional[str]:
+    """Store dates as sortable UTC iso strings"""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = Deserializer.deserialize_iso(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return str(value.astimezone(timezone.utc).isoformat())
+
+
+class BuildStore:
+    """Local SQLite store of completed builds, their timelines and failed tasks.
+
+    sync() only requests the builds that finished after the last sync of a
+    definition and branch (min_time). The history can then be queried locally,
+    e.g. get_previous_build() instead of paging through the builds api.
+    """
+
+    def __init__(self, path: Union[str, Path] = ":memory:") -> None:
+        self.path = path
+        self._connection = sqlite3.connect(str(path))
+        self._connection.row_factory = sqlite3.Row
+        self._connection.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "BuildStore":
+        return self
+
+    def __exit__(self, *exc_details: Any) -> None:
+        self.close()
+
+    def sync(
+        self,
+        pipeline: "AzurePipeline",
+        definition_id: Optional[int] = None,
+        branch: Optional[str] = None,
+        with_timelines: bool = True,
+        page_size: int = 100,
+        max_workers: int = 1,
+    ) -> int:
+        """Fetch the completed builds that finished since the last sync and store them
+
+        Args:
+            pipeline (AzurePipeline): pipeline used to access the api
+            definition_id (Optional[int], optional): pipeline definition. If None, the definition of pipeline's build
+            branch (Optional[str], optional): source branch. If None, the branch of pipeline's build
+            with_timelines (bool, optional): also store the timelines and failed tasks of the builds
+            page_size (int, optional): number of builds requested per api call
+            max_workers (int, optional): number of timelines downloaded in parallel
+
+        Returns:
+            int: number of builds stored
+        """
+        if definition_id is None:
+            definition_id = pipeline._build_pipeline.definition.id
+        if branch is None:
+            branch = pipeline.branch_name
+
+        min_time = self._get_last_finish_time(definition_id, branch)
+        logger.info(
+            "Syncing builds of definition %s on %s since %s",
+            definition_id,
+            branch,
+            min_time,
+        )
+        synced = 0
+        for builds in self._iter_new_builds(
+            pipeline, definition_id, branch, min_time, page_size
+        ):
+            timelines: List[Any] = [None] * len(builds)
+            if with_timelines:
+                with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+                    timelines = list(
+                        executor.map(
+                            lambda build: pipeline.get_timeline(str(build.id)), builds
+                        )
+                    )
+
+            with self._connection:
+                for build, timeline in zip(builds, timelines):
+                    self._insert_build(build)
+                    if timeline is not None:
+                        self._insert_timeline(pipeline, build.id, timeline)
+                last_finish_time = max(
+                    _to_iso(build.finish_time) or "" for build in builds
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)",
+                    (definition_id, branch, last_finish_time),
+                )
+            synced += len(builds)
+        return synced
+
+    def _get_last_finish_time(self, definition_id: int, branch: str) -> Optional[str]:
+        row = self._connection.execute(
+            "SELECT last_finish_time FROM sync_state WHERE definition_id = ? AND branch = ?",
+            (definition_id, branch),
+        ).fetchone()
+        return row["last_finish_time"] if row else None
+
+    def _iter_new_builds(
+        self,
+        pipeline: "AzurePipeline",
+        definition_id: int,
+        branch: str,
+        min_time: Optional[str],
+        page_size: int,
+    ) -> Iterator[List[Any]]:
+        """Iterate over pages of completed builds that are not stored yet, oldest first"""
+        continuation_token = None
+        while True:
+            response = pipeline._build_client.get_builds(
+                pipeline.project,
+                definitions=[definition_id],
+                branch_name=branch,
+                status_filter="completed",
+                query_order="finishTimeAscending",
+                min_time=Deserializer.deserialize_iso(min_time) if min_time else None,
+                top=page_size,
+                continuation_token=continuation_token,
+            )
+            builds, continuation_token = unwrap_builds(response)
+            new_builds = [build for build in builds if not self.has_build(build.id)]
+            if new_builds:
+                yield new_builds
+
+            if not continuation_token:
+                if len(builds) < page_size or not new_builds:
+                    return
+                # No continuation token returned: continue from the last build of the page
+                min_time = _to_iso(builds[-1].finish_time)
+
+    def _insert_build(self, build: Any) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                build.id,
+                build.definition.id,
+                build.definition.name,
+                build.source_branch,
+                build.build_number,
+                build.status,
+                build.result,
+                _to_iso(build.queue_time),
+                _to_iso(build.start_time),
+                _to_iso(build.finish_time),
+                build.source_version,
+            ),
+        )
+
+    def _insert_timeline(
+        self, pipeline: "AzurePipeline", build_id: int, timeline: Any
+    ) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO timelines VALUES (?, ?)",
+            (build_id, json.dumps(pipeline._serialize(timeline))),
+        )
+        index = TimelineIndex.from_timeline(timeline)
+        for task in index.find("Task", "failed"):
+            metadata = get_task_metadata(index, task)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO failed_tasks VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    build_id,
+                    task.id,
+                    task.name,
+                    metadata.get("parent"),
+                    task.log.id if task.log else None,
+                    json.dumps(metadata["issues"]),
+                ),
+            )
+
+    def has_build(self, build_id: Any) -> bool:
+        """Check whether a build is stored"""
+        row = self._connection.execute(
+            "SELECT 1 FROM builds WHERE build_id = ?", (int(build_id),)
+        ).fetchone()
+        return row is not None
+
+    def get_build(self, build_id: Any) -> Optional[Dict[str, Any]]:
+        """Get a stored build as a dict, None if it is not stored"""
+        row = self._connection.execute(
+            "SELECT * FROM builds WHERE build_id = ?", (int(build_id),)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def iter_builds(
+        self,
+        definition_id: int,
+        branch: str,
+        result: Optional[str] = None,
+        since: Optional[Any] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """Iterate over the stored builds of a definition and branch, from the newest to the oldest
+
+        Args:
+            definition_id (int): pipeline definition
+            branch (str): source branch
+            result (Optional[str], optional): only builds with this result (e.g. failed)
+            since (Optional[Any], optional): only builds that finished after this date
+        """
+        query = "SELECT * FROM builds WHERE definition_id = ? AND branch = ?"
+        parameters: List[Any] = [definition_id, branch]
+        if result is not None:
+            query += " AND result = ?"
+            parameters.append(result)
+        if since is not None:
+            query += " AND finish_time > ?"
+            parameters.append(_to_iso(since))
+        query += " ORDER BY start_time DESC"
+        for row in self._connection.execute(query, parameters):
+            yield dict(row)
+
+    def get_previous_build(self, build_id: Any) -> Optional[int]:
+        """Get the build that started before build_id on the same definition and branch
+
+        Returns:
+            Optional[int]: id of the previous build, None if there is none (or build_id is not stored)
+        """
+        row = self._connection.execute(
+            """
+            SELECT previous.build_id FROM builds AS current
+            JOIN builds AS previous
+                ON previous.definition_id = current.definition_id
+                AND previous.branch = current.branch
+                AND previous.start_time < current.start_time
+            WHERE current.build_id = ?
+            ORDER BY previous.start_time DESC
+            LIMIT 1
+            """,
+            (int(build_id),),
+        ).fetchone()
+        return row["build_id"] if row else None
+
+    def get_timeline(self, build_id: Any) -> Optional[Dict[str, Any]]:
+        """Get the serialized timeline of a stored build"""
+        row = self._connection.execute(
+            "SELECT timeline FROM timelines WHERE build_id = ?", (int(build_id),)
+        ).fetchone()
+        return json.loads(row["timeline"]) if row else None
+
+    def get_failed_tasks(self, build_id: Any) -> List[Dict[str, Any]]:
+        """Get the failed tasks of a stored build with their parent job and issue messages"""
+        rows = self._connection.execute(
+            "SELECT * FROM failed_tasks WHERE build_id = ? ORDER BY rowid",
+            (int(build_id),),
+        )
+        return [{**dict(row), "issues": json.loads(row["issues"])} for row in rows]
@@ -0,0 +1,316 @@
+__copyright__ = """
+@copyright (c) 2023 by Nidhal Baccouri. All rights reserved.
+"""
+
+import hashlib
+import logging
+import re
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from azure.devops.v7_1.build.models import Timeline
+
+from azpipeline.models import Failure, FailureTrend
+
+logger = logging.getLogger(__name__)
+
+# Parts of issue messages that change from one build to another
+_VOLATILE_PATTERNS = [
+    (
+        re.compile(
+            r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(\.\d+)?(Z|[+-]\d{2}:?\d{2})?"
+        ),
+        "<time>",
+    ),
+    (
+        re.compile(
+            r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.I
+        ),
+        "<guid>",
+    ),
+    (re.compile(r"\b(?=[0-9a-f]*\d)[0-9a-f]{7,}\b", re.I), "<hex>"),
+    (re.compile(r"\d+"), "<n>"),
+    (re.compile(r"\s+"), " "),
+]
+
+
+class TimelineIndex:
+    """Index over the records of a timeline.
+
+    The index is built once (in a single pass over the records) and then offers
+    O(1) lookups by id, parent_id, type and result, instead of rescanning all
+    the timeline records for every query.
+    """
+
+    def __init__(self, records: Iterable[Any]) -> None:
+        self.records: List[Any] = list(records)
+        self._by_id: Dict[Any, Any] = {}
+        self._children: Dict[Any, List[Any]] = defaultdict(list)
+        self._by_type: Dict[Any, List[Any]] = defaultdict(list)
+        self._by_result: Dict[Any, List[Any]] = defaultdict(list)
+        self._by_type_result: Dict[Tuple[Any, Any], List[Any]] = defaultdict(list)
+
+        for record in self.records:
+            self._by_id[record.id] = record
+            self._children[record.parent_id].append(record)
+            self._by_type[record.type].append(record)
+            self._by_result[record.result].append(record)
+            self._by_type_result[(record.type, record.result)].append(record)
+
+    @classmethod
+    def from_timeline(cls, timeline: Timeline) -> "TimelineIndex":
+        """Build the index of a timeline"""
+        return cls(timeline.records or [])
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, record_id: Any) -> Optional[Any]:
+        """Get a record by its id"""
+        return self._by_id.get(record_id)
+
+    def parent(self, record: Any) -> Optional[Any]:
+        """Get the parent record of a record"""
+        return self._by_id.get(record.parent_id)
+
+    def children(self, record_id: Any) -> List[Any]:
+        """Get the records that have record_id as parent_id"""
+        return self._children.get(record_id, [])
+
+    def by_type(self, record_type: str) -> List[Any]:
+        """Get the records of a given type (e.g. Stage, Job, Task)"""
+        return self._by_type.get(record_type, [])
+
+    def by_result(self, result: str) -> List[Any]:
+        """Get the records with a given result (e.g. failed, succeeded)"""
+        return self._by_result.get(result, [])
+
+    def find(self, record_type: str, result: str) -> List[Any]:
+        """Get the records of a given type and result, in timeline order"""
+        return self._by_type_result.get((record_type, result), [])
+
+
+def is_timeline_complete(timeline: Timeline) -> bool:
+    """Check whether all the records of a timeline are completed, i.e. the timeline won't change anymore"""
+    records = timeline.records or []
+    return bool(records) and all(record.state == "completed" for record in records)
+
+
+class IncrementalTimeline:
+    """Timeline of a build that is kept up to date incrementally.
+
+    The first refresh downloads the whole timeline. The following ones pass the
+    last seen change_id to the timeline API, which then only returns the records
+    that changed since, and merge them into the cached records.
+    """
+
+    def __init__(self, build_client: Any, project: str, build_id: Any) -> None:
+        self._build_client = build_client
+        self.project = project
+        self.build_id = build_id
+        self.change_id: Optional[int] = None
+        self.last_changes: int = 0
+        self._records: Dict[Any, Any] = {}
+        self._timeline: Optional[Timeline] = None
+
+    @property
+    def timeline(self) -> Optional[Timeline]:
+        """Current state of the timeline (None if it was never refreshed)"""
+        return self._timeline
+
+    def refresh(self) -> Optional[Timeline]:
+        """Fetch the records that changed since the last refresh and merge them
+
+        Returns:
+            Optional[Timeline]: up to date timeline of the build
+        """
+        delta: Optional[Timeline] = self._build_client.get_build_timeline(
+            project=self.project, build_id=self.build_id, change_id=self.change_id
+        )
+        if not delta:
+            self.last_changes = 0
+            return self._timeline
+
+        records = delta.records or []
+        for record in records:
+            self._records[record.id] = record
+        self.last_changes = len(records)
+
+        if delta.change_id is not None:
+            self.change_id = max(delta.change_id, self.change_id or 0)
+
+        if records or self._timeline is None:
+            self._timeline = Timeline(
+                change_id=self.change_id,
+                id=delta.id,
+                last_changed_by=delta.last_changed_by,
+                last_changed_on=delta.last_changed_on,
+                records=list(self._records.values()),
+                url=delta.url,
+            )
+        return self._timeline
+
+
+def get_task_metadata(index: TimelineIndex, task: Any) -> Dict[str, Any]:
+    """Get the metadata of a task: its issue messages and the name of its parent job
+
+    Args:
+        index (TimelineIndex): index of the timeline the task belongs to
+        task (Any): timeline record of the task
+
+    Returns:
+        Dict[str, Any]: metadata of the task
+    """
+    # Extract the issue messages of a task, if exist.
+    task_metadata: Dict[str, Any] = {"issues": [d.message for d in task.issues or []]}
+    parent = index.parent(task)
+    if parent is not None and parent.type == "Job":
+        task_metadata["parent"] = parent.name
+    return task_metadata
+
+
+def group_failed_jobs(index: TimelineIndex) -> Any:
+    """Get the names of the failed jobs of a timeline, grouped by stage
+
+    Args:
+        index (TimelineIndex): index of the timeline
+
+    Returns:
+        Any: dict of stage to failed jobs names, or an empty list if no job failed
+    """
+    failed_job_records: Any = defaultdict(list)
+    list_errors: List = []
+
+    for record in index.find("Job", "failed"):
+        failed_job_records[record.type].append(record)
+        logger.info("failed_job_records: %s", failed_job_records)
+
+    # Create a section for each error
+    if "Job" in failed_job_records.keys():
+        for record in failed_job_records["Job"]:
+            error = {
+                "stage": "JobStageErrors",
+                "job": record.name,
+            }
+            if error not in list_errors:
+                list_errors.append(error)
+
+    if len(list_errors) > 0:
+        # Display data grouped by stage
+        group_list: Any = {}
+        for key, value in groupby(list_errors, key=itemgetter("stage")):
+            jobs = []
+            group_list[key] = {}
+            for k in value:
+                if k["job"] not in jobs:
+                    jobs.append(k["job"])
+            group_list[key]["jobs"] = sorted(jobs)
+        return group_list
+    else:
+        return list_errors
+
+
+def normalize_issue_message(message: Optional[str]) -> str:
+    """Remove the parts of an issue message that differ between builds (dates, ids, numbers...)"""
+    message = message or ""
+    for pattern, replacement in _VOLATILE_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message.strip()
+
+
+def _ancestor_name(index: TimelineIndex, record: Any, record_type: str) -> Any:
+    """Get the name of the closest ancestor of a given type of a record"""
+    parent = index.parent(record)
+    while parent is not None and parent.type != record_type:
+        parent = index.parent(parent)
+    return parent.name if parent is not None else None
+
+
+def get_failures(index: TimelineIndex) -> Dict[str, Failure]:
+    """Get the failures of a timeline by fingerprint.
+
+    A failure is a failed task, or a failed job without failed tasks (e.g. a timeout).
+    Its fingerprint hashes the stage, job and task names and the normalized issue
+    messages, so the same failure has the same fingerprint in different builds.
+
+    Args:
+        index (TimelineIndex): index of the timeline
+
+    Returns:
+        Dict[str, Failure]: failures by fingerprint, in timeline order
+    """
+    failures: Dict[str, Failure] = {}
+    failed_records = list(index.find("Task", "failed"))
+    failed_records += [
+        job
+        for job in index.find("Job", "failed")
+        if not any(
+            child.type == "Task" and child.result == "failed"
+            for child in index.children(job.id)
+        )
+    ]
+    for record in failed_records:
+        if record.type == "Task":
+            job, task = _ancestor_name(index, record, "Job"), record.name
+        else:
+            job, task = record.name, None
+        stage = _ancestor_name(index, record, "Stage")
+        issues = tuple(
+            sorted(
+                {
+                    normalize_issue_message(issue.message)
+                    for issue in record.issues or []
+                }
+            )
+        )
+        key = "\x1f".join([str(stage), str(job), str(task), *issues])
+        fingerprint = hashlib.sha1(key.encode()).hexdigest()[:16]
+        failures[fingerprint] = Failure(fingerprint, stage, job, task, issues)
+    return failures
+
+
+def get_failure_trends(
+    history: Sequence[Tuple[Any, Dict[str, Failure]]]
+) -> Dict[str, FailureTrend]:
+    """Get the trend of each failure over a window of builds
+
+    Args:
+        history (Sequence[Tuple[Any, Dict[str, Failure]]]): build ids and their failures, from the newest build
+
+    Returns:
+        Dict[str, FailureTrend]: trends by fingerprint, longest streaks first
+    """
+    build_ids = [build_id for build_id, _ in reversed(history)]
+    # Positions (from the oldest build) of the builds with each failure
+    positions: Dict[str, List[int]] = defaultdict(list)
+    failures: Dict[str, Failure] = {}
+    for position, (_, build_failures) in enumerate(reversed(history)):
+        for fingerprint, failure in build_failures.items():
+            positions[fingerprint].append(position)
+            failures[fingerprint] = failure
+
+    trends = []
+    newest = len(build_ids) - 1
+    for fingerprint, seen in positions.items():
+        streak = 0
+        while streak < len(seen) and seen[-1 - streak] == newest - streak:
+            streak += 1
+        # Every gap between two occurrences is a flip to passing and back to failing
+        flips = 2 * sum(1 for a, b in zip(seen, seen[1:]) if b - a > 1)
+        flips += 0 if streak else 1
+        span = newest - seen[0]
+        trends.append(
+            FailureTrend(
+                failure=failures[fingerprint],
+                first_seen=build_ids[seen[0]],
+                last_seen=build_ids[seen[-1]],
+                failing_since=build_ids[newest - streak + 1] if streak else None,
+                streak=streak,
+                occurrences=len(seen),
+                flakiness=flips / span if span else 0.0,
+            )
+        )
+    trends.sort(key=lambda trend: (-trend.streak, -trend.occurrences))
+    return {trend.failure.fingerprint: trend for trend in trends}
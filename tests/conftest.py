@@ -0,0 +1,99 @@
+from typing import Any, List, Optional
+from unittest.mock import MagicMock
+
+import pytest
+from azure.devops.released.client_factory import ClientFactory
+from azure.devops.v7_1.build import models
+from azure.devops.v7_1.build.models import (
+    Build,
+    BuildLog,
+    BuildLogReference,
+    Issue,
+    Timeline,
+    TimelineRecord,
+)
+from msrest import Deserializer, Serializer
+
+from azpipeline import AzurePipeline
+from azpipeline.connection import connection_pool
+
+LOG_LENGTH = 25
+
+
+def make_record(
+    record_id: str,
+    record_type: str,
+    name: str,
+    parent_id: Any = None,
+    result: str = "succeeded",
+) -> TimelineRecord:
+    return TimelineRecord(
+        id=record_id,
+        parent_id=parent_id,
+        type=record_type,
+        name=name,
+        result=result,
+        state="completed",
+        order=int(record_id.rsplit("-", 1)[-1]),
+        log=BuildLogReference(id=int(record_id.rsplit("-", 1)[-1])),
+        issues=[Issue(type="error", message=f"{name} failed")]
+        if result == "failed"
+        else [],
+    )
+
+
+def make_timeline() -> Timeline:
+    records: List[TimelineRecord] = [
+        make_record("stage-1", "Stage", "Build", result="failed"),
+        make_record("job-2", "Job", "Linux", parent_id="stage-1", result="failed"),
+        make_record("job-3", "Job", "Windows", parent_id="stage-1"),
+        make_record("task-4", "Task", "Checkout", parent_id="job-2"),
+        make_record("task-5", "Task", "Compile", parent_id="job-2", result="failed"),
+        make_record("task-6", "Task", "Test", parent_id="job-2", result="failed"),
+        make_record("task-7", "Task", "Lint", parent_id="job-3"),
+    ]
+    return Timeline(id="timeline", change_id=1, records=records)
+
+
+def get_build_log_lines(
+    project: str,
+    build_id: str,
+    log_id: int,
+    start_line: Optional[int] = None,
+    end_line: Optional[int] = None,
+) -> List[str]:
+    lines = [f"log {log_id} line {i}" for i in range(1, LOG_LENGTH + 1)]
+    first_line = (start_line or 1) - 1
+    return lines[first_line:end_line]
+
+
+@pytest.fixture
+def timeline() -> Timeline:
+    return make_timeline()
+
+
+@pytest.fixture
+def build_client(timeline: Timeline) -> MagicMock:
+    client = MagicMock()
+    client_models = {k: v for k, v in models.__dict__.items() if isinstance(v, type)}
+    client._serialize = Serializer(client_models)
+    client._deserialize = Deserializer(client_models)
+    client.get_build.return_value = Build(id=42, status="completed", result="failed")
+    client.get_build_timeline.return_value = timeline
+    client.get_build_log_lines.side_effect = get_build_log_lines
+    client.get_build_logs.return_value = [
+        BuildLog(id=log_id, line_count=LOG_LENGTH) for log_id in range(1, 8)
+    ]
+    return client
+
+
+@pytest.fixture
+def pipeline(build_client: MagicMock, monkeypatch: pytest.MonkeyPatch) -> AzurePipeline:
+    monkeypatch.setattr(ClientFactory, "get_build_client", lambda self: build_client)
+    connection_pool.clear()
+    return AzurePipeline(
+        build_id="42",
+        token="token",
+        organization_url="https://dev.azure.com/org",
+        project="project",
+    )
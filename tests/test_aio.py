@@ -0,0 +1,100 @@
+import asyncio
+from typing import Any
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from azpipeline.aio import AsyncAzurePipeline
+from azpipeline.classifier import ErrorClassifier
+
+RECORDS = [
+    {"id": "job-1", "type": "Job", "name": "Linux", "result": "failed"},
+    {
+        "id": "task-2",
+        "parentId": "job-1",
+        "type": "Task",
+        "name": "Compile",
+        "result": "failed",
+        "log": {"id": 2},
+        "issues": [{"type": "error", "message": "Compile failed"}],
+    },
+    {"id": "task-3", "parentId": "job-1", "type": "Task", "name": "Lint"},
+]
+BUILD = {
+    "id": 42,
+    "status": "completed",
+    "result": "failed",
+    "sourceBranch": "refs/heads/main",
+    "sourceVersion": "abc",
+    "startTime": "2023-05-01T10:00:00Z",
+    "definition": {"id": 1, "name": "ci"},
+    "requestedBy": {"displayName": "Jane"},
+    "_links": {"web": {"href": "https://dev.azure.com/build/42"}},
+}
+
+
+def make_app() -> web.Application:
+    async def get_build(request: web.Request) -> web.Response:
+        assert request.headers["Authorization"].startswith("Basic ")
+        return web.json_response({**BUILD, "id": int(request.match_info["build"])})
+
+    async def get_builds(request: web.Request) -> web.Response:
+        assert request.query["definitions"] == "1"
+        assert request.query["maxTime"] == "2023-05-01T10:00:00+00:00"
+        assert request.query["$top"] == "2"
+        return web.json_response({"value": [{"id": 42}, {"id": 40}]})
+
+    async def get_timeline(request: web.Request) -> web.Response:
+        return web.json_response({"id": "timeline", "records": RECORDS})
+
+    async def get_log(request: web.Request) -> web.Response:
+        log_id = request.match_info["log"]
+        return web.json_response({"value": [f"log {log_id}"]})
+
+    app = web.Application()
+    app.router.add_get("/org/project/_apis/build/builds", get_builds)
+    app.router.add_get("/org/project/_apis/build/builds/{build}", get_build)
+    app.router.add_get("/org/project/_apis/build/builds/{build}/timeline", get_timeline)
+    app.router.add_get("/org/project/_apis/build/builds/{build}/logs/{log}", get_log)
+    return app
+
+
+async def run_pipeline() -> Any:
+    async with TestServer(make_app()) as server:
+        async with AsyncAzurePipeline(
+            build_id="42",
+            token="token",
+            organization_url=str(server.make_url("/org")),
+            project="project",
+            classifier=ErrorClassifier({"log": "^log"}),
+        ) as pipeline:
+            timeline = await pipeline.get_timeline()
+            return (
+                await pipeline.summary(),
+                [task.name for task in pipeline.get_failed_tasks(timeline)],
+                await pipeline.get_failed_tasks_logs(timeline),
+                await pipeline.get_previous_builds(),
+                await pipeline.failed_jobs(),
+                (await pipeline.get_build("40")).id,
+            )
+
+
+def test_async_pipeline() -> None:
+    summary, failed_tasks, (logs, metadata), previous, jobs, other = asyncio.run(
+        run_pipeline()
+    )
+    assert summary.name == "ci"
+    assert summary.url == "https://dev.azure.com/build/42"
+    assert summary.triggered_by == "Jane"
+    assert failed_tasks == ["Compile"]
+    assert logs == {"Compile": ["log 2"]}
+    assert metadata == {
+        "Compile": {
+            "issues": ["Compile failed"],
+            "parent": "Linux",
+            "categories": ["log"],
+        }
+    }
+    assert previous == 40
+    assert jobs == {"JobStageErrors": {"jobs": ["Linux"]}}
+    assert other == 40
@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import pytest
+
+from azpipeline.archive import LogArchive
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_log_archive(tmp_path: Path, compression: str) -> None:
+    archive = LogArchive(tmp_path, compression)
+    log = [f"line {i}" for i in range(1000)]
+    for build_id in range(1, 201):
+        archive.add_build(build_id, {"Test": log, "Lint": [f"build {build_id}"]})
+    archive.add_build(200, {"Compile": []})
+
+    # The identical logs of the 200 builds are stored once
+    objects = list((tmp_path / "objects").rglob("*.log.*"))
+    assert len(objects) == 202
+    assert archive.object_path(archive.digest(log)).stat().st_size < 10000
+    assert archive.get_index(200) == {
+        "Test": archive.digest(log),
+        "Lint": archive.digest(["build 200"]),
+        "Compile": archive.digest([]),
+    }
+    assert archive.get_build_logs(1) == {"Test": log, "Lint": ["build 1"]}
+    assert archive.get_build_logs(201) == {}
+
+    # Logs removed from the archive are skipped
+    archive.object_path(archive.digest(["build 1"])).unlink()
+    assert archive.get_build_logs(1) == {"Test": log}
+
+    with pytest.raises(ValueError):
+        LogArchive(tmp_path, "bz2")
@@ -0,0 +1,205 @@
+import os
+import time
+from pathlib import Path
+from typing import Any
+from unittest.mock import MagicMock
+
+import pytest
+from azure.devops.v7_1.build.models import Timeline
+
+from azpipeline import AzurePipeline
+from azpipeline.cache import CachedBuildClient, DiskCache, MemoryCache
+from azpipeline.libs import log_file
+from azpipeline.libs.log_file import get_index_path
+
+
+def test_disk_cache(tmp_path: Path) -> None:
+    cache = DiskCache(tmp_path, max_size=25)
+    assert cache.get_bytes(("org", "a")) is None
+    assert cache.size() == 0
+
+    cache.put_lines(("https://dev.azure.com/org", "project", 1, "a.log"), ["x", ""])
+    assert cache.get_lines(("https://dev.azure.com/org", "project", 1, "a.log")) == [
+        "x",
+        "",
+    ]
+    cache.put_lines(("org", "empty"), [])
+    assert cache.get_lines(("org", "empty")) == []
+    assert cache.get_lines(("org", "missing")) is None
+    assert cache.get_json(("org", "missing")) is None
+
+    path_a = cache.put_json(("org", "a"), {"a": 1})
+    path_b = cache.put_json(("org", "b"), {"b": 2})
+    os.utime(path_a, ns=(1, 1))
+    os.utime(path_b, ns=(2, 2))
+    cache.get_json(("org", "a"))
+    cache.put_json(("org", "c"), {"c": 3})
+    assert cache.get_json(("org", "a")) == {"a": 1}
+    assert cache.get_json(("org", "b")) is None
+    # Eviction goes down to the low water mark, not just under max_size
+    assert cache.size() <= 20
+
+    # An entry evicted right after being read is still returned
+    path_c = cache.path(("org", "c"))
+    read_bytes = Path.read_bytes
+
+    def read_and_evict(path: Path) -> bytes:
+        data = read_bytes(path)
+        path.unlink()
+        return data
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(Path, "read_bytes", read_and_evict)
+        assert cache.get_json(("org", "c")) == {"c": 3}
+    assert not path_c.exists()
+
+    cache.clear()
+    assert cache.size() == 0
+    assert cache.get_json(("org", "a")) is None
+
+
+def test_disk_cache_concurrent_eviction(tmp_path: Path) -> None:
+    cache = DiskCache(tmp_path, max_size=20)
+    cache.put_bytes(("org", "a"), b"x" * 10)
+    entries = cache._entries
+    unlink = Path.unlink
+
+    def unlink_twice(path: Path) -> None:
+        # Another process evicts the entry first
+        unlink(path)
+        unlink(path)
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # An entry listed but already removed, and one removed while evicting
+        monkeypatch.setattr(cache, "_entries", lambda: [tmp_path / "gone", *entries()])
+        monkeypatch.setattr(Path, "unlink", unlink_twice)
+        cache.put_bytes(("org", "b"), b"y" * 15)
+    assert cache.get_bytes(("org", "a")) is None
+    assert cache.size() == 15
+
+
+def test_disk_cache_line_index(tmp_path: Path) -> None:
+    cache = DiskCache(tmp_path, max_size=100)
+    path = cache.put_lines(("org", "1.log"), ["a", "b"])
+    log = cache.open_lines(("org", "1.log"))
+    assert log is not None
+    log.close()
+    # The line index counts in the cache size
+    index_size = get_index_path(path).stat().st_size
+    assert cache.size() == DiskCache(tmp_path).size() == 4 + index_size
+    assert cache.open_lines(("org", "missing.log")) is None
+
+    # The log and its index are evicted together
+    os.utime(path, ns=(1, path.stat().st_mtime_ns))
+    cache.put_bytes(("org", "big"), b"x" * 70)
+    assert not path.exists()
+    assert not get_index_path(path).exists()
+    assert cache.size() == 70
+
+
+def test_disk_cache_line_index_removed(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    cache = DiskCache(tmp_path)
+    cache.put_lines(("org", "1.log"), ["a", "b"])
+    opened = []
+    open_file = Path.open
+
+    def record_open(path: Path, *args: Any) -> Any:
+        opened.append(open_file(path, *args))
+        return opened[-1]
+
+    def remove_index(path: Path) -> Path:
+        raise FileNotFoundError(get_index_path(path))
+
+    # The index is removed by another process while the log is opened:
+    # it is a cache miss, and the log isn't left open
+    monkeypatch.setattr(Path, "open", record_open)
+    monkeypatch.setattr(log_file, "build_line_index", remove_index)
+    assert cache.open_lines(("org", "1.log")) is None
+    assert opened and all(file.closed for file in opened)
+
+
+def test_pipeline_disk_cache(
+    pipeline: AzurePipeline, build_client: MagicMock, timeline: Timeline, tmp_path: Path
+) -> None:
+    pipeline._disk_cache = DiskCache(tmp_path)
+    first_logs = pipeline.get_failed_tasks_logs(pipeline.get_timeline())
+    assert pipeline.get_failed_tasks_logs(pipeline.get_timeline()) == first_logs
+    assert build_client.get_build_timeline.call_count == 1
+    assert build_client.get_build_log_lines.call_count == 2
+
+    # Timelines of builds that are still running are not cached
+    timeline.records[-1].state = "inProgress"
+    pipeline.get_timeline(build_id="43")
+    pipeline.get_timeline(build_id="43")
+    assert build_client.get_build_timeline.call_count == 3
+
+
+def test_memory_cache(monkeypatch: pytest.MonkeyPatch) -> None:
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache = MemoryCache(max_entries=2, ttl=5)
+    cache.set("a", 1, ttl=5)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    now[0] += 10
+    assert cache.get("a", "expired") == "expired"
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (2, 2)
+    cache.clear()
+    assert (len(cache), cache.hits, cache.misses) == (0, 0, 0)
+
+
+def test_cached_build_client(build_client: MagicMock, timeline: Timeline) -> None:
+    cache = MemoryCache(ttl=60)
+    client = CachedBuildClient(build_client, cache)
+    for _ in range(2):
+        client.get_build(build_id="42", project="project")
+        client.get_build_timeline(build_id="42", project="project")
+        client.get_builds("project", definitions=[1], branch_name="main")
+        client.get_build_log_lines(project="project", build_id="42", log_id=5)
+    assert build_client.get_build.call_count == 1
+    assert build_client.get_build_timeline.call_count == 1
+    assert build_client.get_builds.call_count == 1
+    assert build_client.get_build_log_lines.call_count == 2
+    assert (cache.hits, cache.misses) == (3, 3)
+
+    # Completed builds and timelines are cached forever, the rest expires
+    expirations = {key[1]: entry[0] for key, entry in cache._entries.items()}
+    assert expirations["get_build"] is None
+    assert expirations["get_build_timeline"] is None
+    assert expirations["get_builds"] is not None
+
+
+def test_pipeline_memory_cache(
+    pipeline: AzurePipeline, build_client: MagicMock
+) -> None:
+    pipeline.cache = MemoryCache()
+    pipeline._cached_build_client = None
+    pipeline.failed_jobs()
+    pipeline.get_failed_tasks(pipeline.get_timeline())
+    assert isinstance(pipeline._build_client, CachedBuildClient)
+    assert build_client.get_build_timeline.call_count == 1
+
+
+def test_pipeline_open_log(
+    pipeline: AzurePipeline, build_client: MagicMock, tmp_path: Path
+) -> None:
+    with pytest.raises(ValueError):
+        pipeline.open_log(5)
+
+    pipeline._disk_cache = DiskCache(tmp_path)
+    with pipeline.open_log(5) as log:
+        assert log[2:4] == ["log 5 line 3", "log 5 line 4"]
+    assert pipeline.tail_log_lines(5, n=2) == ["log 5 line 24", "log 5 line 25"]
+    lines = pipeline.iter_log_lines(5, start_line=20, chunk_size=3)
+    assert list(lines) == [f"log 5 line {i}" for i in range(20, 26)]
+    assert build_client.get_build_log_lines.call_count == 1
+
+    # Only the logs of the current build are cached
+    assert pipeline.head_log_lines(5, n=1, build_id="43") == ["log 5 line 1"]
+    assert build_client.get_build_log_lines.call_count == 2
@@ -0,0 +1,37 @@
+import re
+from typing import Dict
+
+from azpipeline.classifier import ErrorClassifier, Patterns
+
+KNOWN_ERRORS: Dict[str, Patterns] = {
+    "out_of_memory": ["OutOfMemoryError", re.compile(r"exit code 137", re.I)],
+    "network": r"(connection|read) timed? ?out",
+    "flaky_test": r"^FAILED .*::test_\w+ - (AssertionError: )?timeout",
+}
+
+
+def test_error_classifier() -> None:
+    classifier = ErrorClassifier(KNOWN_ERRORS)
+    assert classifier.categories == ["out_of_memory", "network", "flaky_test"]
+    log = [
+        "Compiling...",
+        "FAILED tests/test_api.py::test_get - timeout",
+        "java.lang.OutOfMemoryError: Java heap space",
+        "##[error]Process completed with EXIT CODE 137.",
+    ]
+    assert classifier.classify(iter(log)) == ["out_of_memory", "flaky_test"]
+    assert classifier.classify(["Compiling..."]) == []
+    assert classifier.match_line("read timeout after OutOfMemoryError") == [
+        "out_of_memory",
+        "network",
+    ]
+    assert classifier.match_line("Compiling...") == []
+
+    # Patterns that can't be combined are matched one by one
+    classifier = ErrorClassifier({"network": "(?i)connection timeout"})
+    assert classifier.classify(["CONNECTION TIMEOUT"]) == ["network"]
+    assert ErrorClassifier({}).classify(log) == []
+
+    # Flags are kept in the prefilter, e.g. ascii word boundaries
+    classifier = ErrorClassifier({"oom": re.compile(r"\bOOM\b", re.A)})
+    assert classifier.classify(["\u00e9OOM killed"]) == ["oom"]
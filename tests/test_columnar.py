@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+
+from azure.devops.v7_1.build.models import Timeline
+
+from azpipeline.columnar import TimelineTable
+from azpipeline.models import CompactTimeline, JsonView
+
+
+def test_timeline_table(timeline: Timeline) -> None:
+    for i, record in enumerate(timeline.records):
+        record.start_time = datetime(2023, 5, 1, 10, tzinfo=timezone.utc)
+        record.finish_time = datetime(2023, 5, 1, 10, i, tzinfo=timezone.utc)
+    timeline.records[0].finish_time = None
+
+    table = TimelineTable.from_timeline(timeline)
+    assert len(table) == 7
+    assert [r.name for r in table.failed_tasks()] == ["Compile", "Test"]
+    assert table.failed_jobs() == ["Linux"]
+    assert list(table.ids[table.failed_tasks_parents()]) == ["job-2", "job-2"]
+    assert table.parent[0] == -1
+    assert table.mask("Task", "failed", "completed").sum() == 2
+    assert not table.mask("Task", "canceled").any()
+    assert table.duration_stats("Task") == {
+        "count": 4,
+        "total": 1080.0,
+        "mean": 270.0,
+        "median": 270.0,
+        "p95": 351.0,
+        "max": 360.0,
+    }
+    assert table.duration_stats("Phase") == {"count": 0}
+
+    compact = TimelineTable.from_timeline(CompactTimeline.from_timeline(timeline))
+    assert compact.failed_jobs() == ["Linux"]
+
+
+def test_timeline_table_raw() -> None:
+    raw = JsonView(
+        {
+            "records": [
+                {
+                    "id": "1",
+                    "type": "Task",
+                    "result": "failed",
+                    "startTime": "2023-05-01T10:00:00.1234567Z",
+                    "finishTime": "2023-05-01T10:00:01.6234567Z",
+                }
+            ]
+        }
+    )
+    table = TimelineTable.from_timeline(raw)
+    assert table.durations()[0] == 1.5
@@ -0,0 +1,54 @@
+from unittest.mock import MagicMock
+
+import pytest
+import requests
+from azure.devops.released.client_factory import ClientFactory
+from requests.adapters import HTTPAdapter
+
+from azpipeline import AzurePipeline
+from azpipeline.connection import ConnectionPool, connection_pool
+
+
+def test_connection_pool(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(ClientFactory, "get_build_client", lambda self: MagicMock())
+    pool = ConnectionPool()
+    client = pool.get_build_client("https://dev.azure.com/org", "token")
+    assert pool.get_build_client("https://dev.azure.com/org", "token") is client
+    assert pool.get_build_client("https://dev.azure.com/org", "other") is not client
+    assert client.config.keep_alive is True
+
+    pool.configure(pool_connections=2, pool_maxsize=32)
+    session = requests.Session()
+    kwargs = client.config.session_configuration_callback(session, None, None, a=1)
+    assert kwargs == {"a": 1}
+    adapter = session.get_adapter("https://dev.azure.com")
+    assert isinstance(adapter, HTTPAdapter)
+    assert adapter._pool_maxsize == 32
+    client.config.session_configuration_callback(session, None, None)
+    assert session.get_adapter("https://dev.azure.com") is adapter
+
+    pool.clear()
+    assert pool.get_build_client("https://dev.azure.com/org", "token") is not client
+
+
+def test_pipelines_share_build_client(
+    pipeline: AzurePipeline, build_client: MagicMock, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    other = AzurePipeline(
+        build_id="43",
+        token="token",
+        organization_url="https://dev.azure.com/org",
+        project="project",
+    )
+    assert other._build_client is pipeline._build_client
+
+    get_build_client = MagicMock()
+    monkeypatch.setattr(connection_pool, "get_build_client", get_build_client)
+    unshared = AzurePipeline(
+        build_id="44",
+        token="token",
+        organization_url="https://dev.azure.com/org",
+        share_connection=False,
+    )
+    assert unshared._build_client is build_client
+    get_build_client.assert_not_called()
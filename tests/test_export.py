@@ -0,0 +1,52 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pyarrow.dataset as ds
+from azure.devops.v7_1.build.models import (
+    Build,
+    DefinitionReference,
+    IdentityRef,
+    Timeline,
+)
+
+from azpipeline.export import ParquetExporter
+from azpipeline.models import JsonView
+
+
+def make_build(build_id: int, branch: str = "refs/heads/main") -> Build:
+    return Build(
+        id=build_id,
+        definition=DefinitionReference(id=1, name="ci"),
+        source_branch=branch,
+        status="completed",
+        result="failed",
+        start_time=datetime(2023, 5, 1, 10, tzinfo=timezone.utc),
+        requested_for=IdentityRef(display_name="Jane"),
+    )
+
+
+def test_parquet_exporter(timeline: Timeline, tmp_path: Path) -> None:
+    exporter = ParquetExporter(tmp_path)
+    timeline.records[0].start_time = datetime(2023, 5, 1, 10)
+    exporter.append_timeline(timeline, make_build(1))
+    exporter.append_timeline(timeline, make_build(2, branch="refs/heads/dev"))
+    raw = JsonView(
+        {"records": [{"id": "x", "type": "Task", "startTime": "2023-05-01T10:00:00Z"}]}
+    )
+    exporter.append_timeline(raw, make_build(3))
+    # Exporting a build again replaces its previous export
+    exporter.append_timeline(timeline, make_build(1))
+
+    timelines = ds.dataset(exporter.timelines_dir, partitioning="hive").to_table()
+    assert timelines.num_rows == 15
+    failed = ds.dataset(exporter.timelines_dir, partitioning="hive").to_table(
+        filter=(ds.field("result") == "failed") & (ds.field("type") == "Task")
+    )
+    assert sorted(failed["build_id"].to_pylist()) == [1, 1, 2, 2]
+    assert failed["issues"][0].as_py() == ["Compile failed"]
+
+    exporter.append_builds([make_build(1), make_build(2)])
+    exporter.append_builds([])
+    builds = ds.dataset(exporter.builds_dir, partitioning="hive").to_table()
+    assert sorted(builds["build_id"].to_pylist()) == [1, 2]
+    assert builds["requested_for"].to_pylist() == ["Jane", "Jane"]
@@ -0,0 +1,51 @@
+import os
+import re
+from pathlib import Path
+
+import pytest
+
+from azpipeline.libs.log_file import LogFile, get_index_path
+
+
+def test_log_file(tmp_path: Path) -> None:
+    path = tmp_path / "task.log"
+    path.write_text("".join(f"line {i}\n" for i in range(100000)))
+
+    with LogFile(path) as log:
+        assert len(log) == 100000
+        assert log[0] == "line 0"
+        assert log[-1] == "line 99999"
+        assert log[500:503] == ["line 500", "line 501", "line 502"]
+        assert log[99998:200000] == ["line 99998", "line 99999"]
+        assert log[10:0] == []
+        assert log[0:30:10] == ["line 0", "line 10", "line 20"]
+        assert log.tail(2) == ["line 99998", "line 99999"]
+        assert log.tail(0) == []
+        assert list(log.grep(r"^line 4242\d$")) == [
+            (42420 + i, f"line 4242{i}") for i in range(10)
+        ]
+        assert [line for line, _ in log.grep("line 1", max_hits=3)] == [1, 10, 11]
+        with pytest.raises(IndexError):
+            log[100000]
+    assert get_index_path(path).stat().st_size == 20 + 8 * 100001
+
+    # The index is rebuilt when the log changes
+    path.write_text("Error: first\nWARNING\nerror: last")
+    with LogFile(path) as log:
+        assert log[:] == ["Error: first", "WARNING", "error: last"]
+        assert list(log.grep(re.compile("^error", re.I))) == [
+            (0, "Error: first"),
+            (2, "error: last"),
+        ]
+
+    # Same size but modified: the index is rebuilt too
+    mtime_ns = path.stat().st_mtime_ns
+    path.write_text("Error: first\nWARNING\nerror\nlast")
+    os.utime(path, ns=(mtime_ns, mtime_ns + 1))
+    with LogFile(path) as log:
+        assert log[-2:] == ["error", "last"]
+
+    path.write_text("")
+    with LogFile(path) as log:
+        assert len(log) == 0
+        assert list(log.grep(".*")) == []
@@ -0,0 +1,93 @@
+import io
+import zipfile
+from typing import Dict
+from unittest.mock import MagicMock
+
+import pytest
+from azure.devops.v7_1.build.models import Timeline
+
+from azpipeline import AzurePipeline
+from azpipeline.libs.logs_zip import (
+    ZipLogKey,
+    _spool,
+    extract_zip_logs,
+    get_zip_log_key,
+    parse_zip_log_member,
+)
+
+
+def make_zip(members: dict) -> list:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
+        for name, content in members.items():
+            zip_file.writestr(name, content)
+    data = buffer.getvalue()
+    return [data[i : i + 100] for i in range(0, len(data), 100)]  # noqa: E203
+
+
+def test_parse_zip_log_member() -> None:
+    assert parse_zip_log_member("Build/Build Linux/3_Run: tests.txt") == (
+        ("build", "build_linux"),
+        3,
+        "run_tests",
+    )
+    assert parse_zip_log_member("1_Initialize job.txt") == ((), 1, "initialize_job")
+    assert parse_zip_log_member("Build Linux/readme.md") is None
+    assert get_zip_log_key([None], 2, "Run: tests") == ((), 2, "run_tests")
+
+
+def test_extract_zip_logs_ambiguous_keys() -> None:
+    wanted: Dict[ZipLogKey, int] = {
+        (("build", "linux"), 5, "compile"): 5,
+        (("release", "linux"), 5, "compile"): 9,
+    }
+    chunks = make_zip(
+        {"Build/Linux/5_Compile.txt": "a\n", "Release/Linux/5_Compile.txt": "b"}
+    )
+    assert extract_zip_logs(chunks, wanted) == {5: ["a"], 9: ["b"]}
+    # Without stage folders, both tasks match the same member
+    assert extract_zip_logs(make_zip({"Linux/5_Compile.txt": "a\n"}), wanted) == {}
+    # The same task matches several members
+    chunks = make_zip({"Build/Linux/5_Compile.txt": "a\n", "Linux/5_Compile.txt": "b"})
+    assert extract_zip_logs(chunks, {(("build", "linux"), 5, "compile"): 5}) == {}
+
+
+@pytest.mark.parametrize("spool_size", [0, 1 << 20])
+def test_extract_zip_logs_spool(spool_size: int) -> None:
+    chunks = make_zip({"Linux/5_Compile.txt": "a\nb\n"})
+    # zipfile needs a seekable file, on every python version
+    with _spool(chunks, spool_size) as spooled:
+        assert spooled.seekable()
+        assert isinstance(spooled, io.BytesIO) == (spool_size > 0)
+    wanted: Dict[ZipLogKey, int] = {(("linux",), 5, "compile"): 5}
+    assert extract_zip_logs(chunks, wanted, spool_size) == {5: ["a", "b"]}
+
+
+def test_failed_tasks_logs_from_zip(
+    pipeline: AzurePipeline, build_client: MagicMock, timeline: Timeline
+) -> None:
+    build_client.get_build_logs_zip.return_value = make_zip(
+        {
+            "Build/Linux/4_Checkout.txt": "checkout\n",
+            "Build/Linux/5_Compile.txt": "\ufeffcompiling\r\nerror\r\n",
+            "Build/Windows/7_Lint.txt": "lint\n",
+        }
+    )
+    pipeline.logs_zip_threshold = 1
+    logs, metadata = pipeline.get_failed_tasks_logs(timeline)
+    build_client.get_build_logs_zip.assert_called_once_with(
+        project="project", build_id="42"
+    )
+    assert logs["Compile"] == ["compiling", "error"]
+    # Test is missing from the zip: its log is downloaded on its own
+    assert logs["Test"][0] == "log 6 line 1"
+    build_client.get_build_log_lines.assert_called_once_with(
+        project="project", build_id="42", log_id=6
+    )
+    assert metadata["Compile"]["parent"] == "Linux"
+
+    # Failed tasks that can't be told apart in the zip: it isn't downloaded
+    build_client.get_build_logs_zip.reset_mock()
+    timeline.records[5].name, timeline.records[5].order = "Compile", 5
+    pipeline.get_failed_tasks_logs(timeline)
+    build_client.get_build_logs_zip.assert_not_called()
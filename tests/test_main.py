@@ -1,6 +1,17 @@
+import re
+from datetime import datetime
+from pathlib import Path
+from unittest.mock import MagicMock
+
 import pytest
+from azure.devops.v7_1.build.models import Build, DefinitionReference, Timeline
 
 from azpipeline import AzurePipeline
+from azpipeline.archive import LogArchive
+from azpipeline.cache import DiskCache
+from azpipeline.classifier import ErrorClassifier
+from azpipeline.libs.utils import JSONL_SUFFIXES, read_jsonl, unwrap_builds
+from tests.conftest import make_timeline
 
 
 def test_build_id() -> None:
@@ -8,3 +19,314 @@ def test_build_id() -> None:
         AzurePipeline(build_id="")
     assert e.type == SystemExit
     assert e.value.code == 1
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_get_failed_tasks_logs(
+    pipeline: AzurePipeline, timeline: Timeline, max_workers: int
+) -> None:
+    logs, metadata = pipeline.get_failed_tasks_logs(timeline, max_workers=max_workers)
+    assert list(logs) == ["Compile", "Test"]
+    assert logs["Test"] == [f"log 6 line {i}" for i in range(1, 26)]
+    assert metadata["Compile"] == {"issues": ["Compile failed"], "parent": "Linux"}
+
+
+def test_failed_jobs(pipeline: AzurePipeline, timeline: Timeline) -> None:
+    assert pipeline.failed_jobs() == {"JobStageErrors": {"jobs": ["Linux"]}}
+    assert pipeline.get_timeline_index(timeline) is pipeline.get_timeline_index(
+        timeline
+    )
+
+
+def test_get_incremental_timeline(pipeline: AzurePipeline) -> None:
+    incremental = pipeline.get_incremental_timeline(build_id="7")
+    assert incremental.build_id == "7"
+    assert incremental.project == "project"
+
+
+def test_lazy_build(pipeline: AzurePipeline, build_client: MagicMock) -> None:
+    build_client.get_build.assert_not_called()
+    assert pipeline.prefetch() is pipeline
+    assert pipeline.result == "failed"
+    assert pipeline.status == "completed"
+    build_client.get_build.assert_called_once_with(build_id="42", project="project")
+
+
+def test_for_builds(pipeline: AzurePipeline, build_client: MagicMock) -> None:
+    build_client.get_builds.side_effect = [
+        [Build(id=1, result="failed"), Build(id=2, result="succeeded")],
+        [Build(id=3, result="canceled")],
+    ]
+    pipelines = AzurePipeline.for_builds(
+        [1, 2, 3, 4],
+        batch_size=2,
+        token="token",
+        organization_url="https://dev.azure.com/org",
+        project="project",
+    )
+    assert [p.build_id for p in pipelines] == ["1", "2", "3", "4"]
+    assert [p.result for p in pipelines] == [
+        "failed",
+        "succeeded",
+        "canceled",
+        "failed",
+    ]
+    build_client.get_builds.assert_called_with("project", build_ids=["3", "4"], top=2)
+    build_client.get_build.assert_called_once_with(build_id="4", project="project")
+    assert AzurePipeline.for_builds([], token="token") == []
+
+
+def test_unwrap_builds() -> None:
+    assert unwrap_builds(None) == ([], None)
+    response = MagicMock(value=[1, 2], continuation_token="next")
+    assert unwrap_builds(response) == ([1, 2], "next")
+
+
+def test_previous_builds(pipeline: AzurePipeline, build_client: MagicMock) -> None:
+    started = datetime(2023, 5, 1)
+    build_client.get_build.return_value = Build(
+        id=42,
+        start_time=started,
+        definition=DefinitionReference(id=1),
+        source_branch="refs/heads/main",
+    )
+    build_client.get_builds.side_effect = [
+        [Build(id=42, start_time=started), Build(id=41, start_time=started)],
+        [Build(id=40, start_time=started), Build(id=39, start_time=started)],
+    ]
+    assert pipeline.get_previous_builds() == 41
+    build_client.get_builds.assert_called_once_with(
+        "project",
+        definitions=[1],
+        branch_name="refs/heads/main",
+        query_order="startTimeDescending",
+        max_time=started,
+        top=2,
+        continuation_token=None,
+    )
+
+    build_client.get_builds.side_effect = [
+        MagicMock(value=[Build(id=42), Build(id=41)], continuation_token="next"),
+        [Build(id=41, start_time=started), Build(id=40, start_time=started)],
+        [],
+    ]
+    assert [b.id for b in pipeline.iter_previous_builds(page_size=2)] == [41, 40]
+    assert build_client.get_builds.call_count == 4
+    assert (
+        build_client.get_builds.call_args_list[2].kwargs["continuation_token"] == "next"
+    )
+
+    build_client.get_builds.side_effect = [[Build(id=42)]]
+    assert pipeline.get_previous_builds() is None
+
+
+def test_iter_log_lines(pipeline: AzurePipeline, build_client: MagicMock) -> None:
+    assert list(pipeline.iter_log_lines(5, chunk_size=10)) == [
+        f"log 5 line {i}" for i in range(1, 26)
+    ]
+    assert build_client.get_build_log_lines.call_count == 3
+    assert list(pipeline.iter_log_lines(5, start_line=3, end_line=4)) == [
+        "log 5 line 3",
+        "log 5 line 4",
+    ]
+    assert list(pipeline.iter_log_lines(5, start_line=21, chunk_size=5)) == [
+        f"log 5 line {i}" for i in range(21, 26)
+    ]
+    assert pipeline.head_log_lines(5, n=2) == ["log 5 line 1", "log 5 line 2"]
+    assert pipeline.head_log_lines(5, n=0) == []
+    assert pipeline.tail_log_lines(5, n=2) == ["log 5 line 24", "log 5 line 25"]
+    assert pipeline.tail_log_lines(99) == []
+
+
+def test_compare_with_prev_build(
+    pipeline: AzurePipeline, build_client: MagicMock
+) -> None:
+    previous_timeline = make_timeline()
+    previous_timeline.records[5].result = "succeeded"
+    previous_timeline.records[6].result = "failed"
+    fixed_timeline = make_timeline()
+    for record in fixed_timeline.records:
+        record.result = "succeeded"
+    timelines = {"40": fixed_timeline, "41": previous_timeline, "42": make_timeline()}
+    build_client.get_build_timeline.side_effect = lambda project, build_id: timelines[
+        build_id
+    ]
+
+    comparison = pipeline.compare_with_prev_build("41")
+    assert comparison.curr_build == "42"
+    assert [f.task for f in comparison.new] == ["Test"]
+    assert [f.task for f in comparison.fixed] == ["Lint"]
+    assert [f.task for f in comparison.repeated] == ["Compile"]
+    assert comparison.message == "new failure!"
+
+    assert pipeline.compare_with_prev_build("42").message == "repeated failure"
+    assert pipeline.compare_with_prev_build(None).message == "new failure!"
+    assert pipeline.compare_with_prev_build("41", "40").message == "back to normal"
+    assert pipeline.compare_with_prev_build("40", "40").message is None
+
+    # The failures are computed once per build
+    assert build_client.get_build_timeline.call_count == 3
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_get_failure_trends(
+    pipeline: AzurePipeline, build_client: MagicMock, max_workers: int
+) -> None:
+    build_client.get_build.return_value = Build(
+        id=42, definition=DefinitionReference(id=1), source_branch="refs/heads/main"
+    )
+    build_client.get_builds.return_value = [Build(id=i) for i in range(42, 37, -1)]
+    failing_tasks = {
+        "42": {"Compile", "Test"},
+        "41": {"Compile"},
+        "40": {"Compile", "Test"},
+        "39": {"Compile", "Lint"},
+        "38": {"Test"},
+    }
+
+    def get_build_timeline(project: str, build_id: str) -> Timeline:
+        timeline = make_timeline()
+        for record in timeline.records[3:]:
+            failed = record.name in failing_tasks[build_id]
+            record.result = "failed" if failed else "succeeded"
+        return timeline
+
+    build_client.get_build_timeline.side_effect = get_build_timeline
+
+    trends = pipeline.get_failure_trends(window=5, max_workers=max_workers)
+    assert [t.failure.task for t in trends.values()] == ["Compile", "Test", "Lint"]
+    compile_trend, test_trend, lint_trend = trends.values()
+    assert (compile_trend.first_seen, compile_trend.last_seen) == ("39", "42")
+    assert (compile_trend.failing_since, compile_trend.streak) == ("39", 4)
+    assert compile_trend.flakiness == 0.0
+    assert (test_trend.failing_since, test_trend.streak) == ("42", 1)
+    assert (test_trend.first_seen, test_trend.occurrences) == ("38", 3)
+    assert test_trend.flakiness == 1.0
+    assert (lint_trend.failing_since, lint_trend.streak) == (None, 0)
+    assert lint_trend.last_seen == "39"
+    assert lint_trend.flakiness == pytest.approx(1 / 3)
+    assert build_client.get_build_timeline.call_count == 5
+
+
+def test_bisect_failure(pipeline: AzurePipeline, build_client: MagicMock) -> None:
+    build_client.get_build.return_value = Build(
+        id=42, definition=DefinitionReference(id=1), source_branch="refs/heads/main"
+    )
+    build_client.get_builds.return_value = [Build(id=i) for i in range(41, 0, -1)]
+
+    def get_build_timeline(project: str, build_id: str) -> Timeline:
+        timeline = make_timeline()
+        if int(build_id) < 17:
+            timeline.records[5].result = "succeeded"
+        return timeline
+
+    build_client.get_build_timeline.side_effect = get_build_timeline
+    test_failure = [f for f in pipeline.get_failures().values() if f.task == "Test"]
+
+    result = pipeline.bisect_failure(test_failure[0].fingerprint)
+    assert (result.first_failing, result.last_passing) == ("17", "16")
+    assert result.builds_searched == 42
+    # The failures of the current build were already known
+    assert result.timelines_fetched == build_client.get_build_timeline.call_count - 1
+    assert result.timelines_fetched <= 6
+    assert build_client.get_builds.call_count == 1
+    # Everything is known the second time
+    result = pipeline.bisect_failure(test_failure[0].fingerprint)
+    assert result.first_failing == "17"
+    assert result.timelines_fetched == 0
+
+    compile_failure = [f for f in pipeline.get_failures().values() if f.task != "Test"]
+    result = pipeline.bisect_failure(compile_failure[0].fingerprint, max_builds=10)
+    assert (result.first_failing, result.last_passing) == ("32", None)
+
+    with pytest.raises(ValueError):
+        pipeline.bisect_failure("missing")
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+def test_save_logs(
+    pipeline: AzurePipeline, timeline: Timeline, tmp_path: Path, compression: str
+) -> None:
+    pipeline.save_logs = True
+    pipeline.logs_dir = tmp_path
+    pipeline.save_logs_compression = compression
+    pipeline.get_failed_tasks_logs(pipeline.get_timeline())
+
+    suffix = JSONL_SUFFIXES[compression]
+    records = list(read_jsonl(tmp_path / f"timeline{suffix}"))
+    assert [record["id"] for record in records] == [r.id for r in timeline.records]
+    failed_tasks = read_jsonl(tmp_path / f"failed_tasks{suffix}")
+    assert [task["name"] for task in failed_tasks] == ["Compile", "Test"]
+    archive = LogArchive(tmp_path / "archive", compression or "gzip")
+    logs = archive.get_build_logs("42")
+    assert logs["Compile"] == [f"log 5 line {i}" for i in range(1, 26)]
+    metadata = list(read_jsonl(tmp_path / f"tasks_metadata{suffix}"))
+    assert metadata[1] == {"task": "Test", "issues": ["Test failed"], "parent": "Linux"}
+
+
+@pytest.mark.parametrize("max_workers", [1, 4])
+def test_search_logs(
+    pipeline: AzurePipeline, build_client: MagicMock, max_workers: int
+) -> None:
+    hits = pipeline.search_logs(
+        r"line 2[45]$", build_ids=[42, 43], max_workers=max_workers
+    )
+    assert [(h.build_id, h.task, h.line_number) for h in hits] == [
+        (build_id, task, line_number)
+        for build_id in ("42", "43")
+        for task in ("Compile", "Test")
+        for line_number in (24, 25)
+    ]
+    assert hits[0].snippet == "log 5 line 24"
+
+    hits = pipeline.search_logs("line", max_hits=3, max_workers=max_workers)
+    assert len(hits) == 3
+
+    hits = pipeline.search_logs(re.compile("LOG 7 LINE 1$", re.I), scope="all")
+    assert [(h.task, h.line_number) for h in hits] == [("Lint", 1)]
+
+    with pytest.raises(ValueError):
+        pipeline.search_logs("line", scope="succeeded")
+
+
+def test_search_cached_logs(pipeline: AzurePipeline, tmp_path: Path) -> None:
+    pipeline._disk_cache = DiskCache(tmp_path)
+    pipeline.get_failed_tasks_logs(pipeline.get_timeline())
+    hits = pipeline.search_logs("line 1[0-2]$", snippet_length=6)
+    assert [(h.task, h.line_number, h.snippet) for h in hits] == [
+        ("Compile", 10, "log 5 "),
+        ("Compile", 11, "log 5 "),
+        ("Compile", 12, "log 5 "),
+        ("Test", 10, "log 6 "),
+        ("Test", 11, "log 6 "),
+        ("Test", 12, "log 6 "),
+    ]
+    assert len(pipeline.search_logs("line", max_hits=1)) == 1
+    # Lines are matched one by one, like lines read from the api
+    assert pipeline.search_logs(r"24\s+log") == []
+
+
+def test_search_cached_logs_of_other_builds(
+    pipeline: AzurePipeline, build_client: MagicMock, tmp_path: Path
+) -> None:
+    pipeline._disk_cache = DiskCache(tmp_path)
+    for build_id in ("43", "42"):
+        pipeline.build_id = build_id
+        pipeline.get_failed_tasks_logs(pipeline.get_timeline())
+    build_client.get_build_log_lines.reset_mock()
+
+    hits = pipeline.search_logs("line 25$", build_ids=[42, 43])
+    assert [(h.build_id, h.task) for h in hits] == [
+        ("42", "Compile"),
+        ("42", "Test"),
+        ("43", "Compile"),
+        ("43", "Test"),
+    ]
+    build_client.get_build_log_lines.assert_not_called()
+
+
+def test_classify_failed_tasks(pipeline: AzurePipeline, timeline: Timeline) -> None:
+    pipeline.classifier = ErrorClassifier({"log_5": r"^log 5 ", "end": "line 25$"})
+    _, metadata = pipeline.get_failed_tasks_logs(timeline)
+    assert metadata["Compile"]["categories"] == ["log_5", "end"]
+    assert metadata["Test"]["categories"] == ["end"]
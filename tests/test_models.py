@@ -0,0 +1,95 @@
+import json
+from pathlib import Path
+from unittest.mock import MagicMock
+
+import pytest
+from azure.devops.v7_1.build.models import Timeline
+
+from azpipeline import AzurePipeline
+from azpipeline.cache import DiskCache, MemoryCache
+from azpipeline.models import CompactIssue, CompactRecord, CompactTimeline, JsonView
+
+
+def test_json_view() -> None:
+    view = JsonView({"parentId": "1", "log": {"id": 2}, "issues": [{"message": "x"}]})
+    assert view.parent_id == "1"
+    assert view.log.id == 2
+    assert [issue.message for issue in view.issues] == ["x"]
+    assert view.finish_time is None
+    assert view == JsonView(view.to_dict())
+    assert repr(JsonView({})) == "JsonView({})"
+    assert not hasattr(view, "__missing__")
+
+
+def test_raw_timeline(
+    pipeline: AzurePipeline, build_client: MagicMock, timeline: Timeline, tmp_path: Path
+) -> None:
+    data = build_client._serialize.body(timeline, "Timeline")
+    build_client._send.return_value = MagicMock(
+        content=json.dumps(data).encode(), json=lambda: data
+    )
+    expected = pipeline.get_failed_tasks_logs(timeline)
+
+    pipeline.raw = True
+    raw_timeline = pipeline.get_timeline()
+    assert isinstance(raw_timeline, JsonView)
+    build_client.get_build_timeline.assert_not_called()
+    assert build_client._send.call_args.kwargs["route_values"] == {
+        "project": "project",
+        "buildId": "42",
+    }
+    assert [t.name for t in pipeline.get_failed_tasks(raw_timeline)] == [
+        "Compile",
+        "Test",
+    ]
+    assert pipeline.get_failed_tasks_logs(raw_timeline) == expected
+    assert pipeline._serialize(pipeline.get_failed_tasks(raw_timeline))[0] == (
+        data["records"][4]
+    )
+
+    pipeline._disk_cache = DiskCache(tmp_path)
+    assert pipeline.get_timeline("43") == pipeline.get_timeline("43")
+    assert build_client._send.call_count == 2
+
+    build_client._send.return_value = MagicMock(content=b"")
+    assert pipeline._get_raw_timeline("43") is None
+
+
+def test_raw_timeline_memory_cache(
+    pipeline: AzurePipeline, build_client: MagicMock, timeline: Timeline
+) -> None:
+    data = build_client._serialize.body(timeline, "Timeline")
+    build_client._send.return_value = MagicMock(
+        content=json.dumps(data).encode(), json=lambda: data
+    )
+    pipeline.raw = True
+    pipeline.cache = MemoryCache()
+    pipeline.failed_jobs()
+    pipeline.failed_jobs()
+    assert build_client._send.call_count == 1
+    assert (pipeline.cache.hits, pipeline.cache.misses) == (1, 1)
+    # Complete timelines are cached forever
+    assert [expires_at for expires_at, _ in pipeline.cache._entries.values()] == [None]
+
+
+def test_compact_timeline(pipeline: AzurePipeline, timeline: Timeline) -> None:
+    compact = CompactTimeline.from_timeline(timeline)
+    assert len(compact.records) == len(timeline.records)
+    record = compact.records[4]
+    assert not hasattr(record, "__dict__")
+    with pytest.raises(AttributeError):
+        record.name = "other"  # type: ignore
+    assert record.log is not None
+    assert (record.id, record.parent_id, record.log.id) == ("task-5", "job-2", 5)
+    assert record.issues == (CompactIssue(type="error", message="Compile failed"),)
+    assert CompactRecord.from_record(JsonView({})).log is None
+    assert record.to_dict()["issues"] == [
+        {"type": "error", "message": "Compile failed"}
+    ]
+
+    assert pipeline.get_failed_tasks_logs(compact) == pipeline.get_failed_tasks_logs(
+        timeline
+    )
+    assert pipeline._serialize(pipeline.get_failed_tasks(compact))[0]["name"] == (
+        "Compile"
+    )
@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest.mock import MagicMock
+
+from azure.devops.v7_1.build.models import Build, DefinitionReference
+
+from azpipeline import AzurePipeline
+from azpipeline.store import BuildStore
+
+
+def make_build(build_id: int, result: str = "failed") -> Build:
+    start_time = datetime(2023, 5, 1, tzinfo=timezone.utc) + timedelta(hours=build_id)
+    return Build(
+        id=build_id,
+        definition=DefinitionReference(id=1, name="ci"),
+        source_branch="refs/heads/main",
+        status="completed",
+        result=result,
+        start_time=start_time,
+        finish_time=start_time + timedelta(minutes=30),
+    )
+
+
+def test_build_store_sync(
+    pipeline: AzurePipeline, build_client: MagicMock, tmp_path: Path
+) -> None:
+    build_client.get_build.return_value = make_build(42)
+    build_client.get_builds.side_effect = [
+        [make_build(1, "succeeded"), make_build(2)],
+        # Without continuation token the next page starts at the last finish time
+        [make_build(2), make_build(3)],
+        [make_build(3)],
+        [],
+    ]
+
+    with BuildStore(tmp_path / "builds.db") as store:
+        assert store.sync(pipeline, page_size=2, max_workers=2) == 3
+        assert store.sync(pipeline, page_size=2) == 0
+
+        kwargs = build_client.get_builds.call_args_list[0].kwargs
+        assert kwargs["definitions"] == [1]
+        assert kwargs["branch_name"] == "refs/heads/main"
+        assert kwargs["min_time"] is None
+        assert (
+            build_client.get_builds.call_args_list[1].kwargs["min_time"]
+            == make_build(2).finish_time
+        )
+        assert (
+            build_client.get_builds.call_args.kwargs["min_time"]
+            == make_build(3).finish_time
+        )
+
+        build = store.get_build(2)
+        assert build is not None and build["result"] == "failed"
+        assert store.get_build(4) is None
+        stored_timeline = store.get_timeline(1)
+        assert stored_timeline is not None
+        assert stored_timeline["records"][0]["id"] == "stage-1"
+        assert store.get_timeline(4) is None
+        failed_tasks = store.get_failed_tasks(3)
+        assert [task["name"] for task in failed_tasks] == ["Compile", "Test"]
+        assert failed_tasks[0]["parent"] == "Linux"
+        assert failed_tasks[0]["issues"] == ["Compile failed"]
+
+        builds = store.iter_builds(1, "refs/heads/main")
+        assert [build["build_id"] for build in builds] == [3, 2, 1]
+        builds = store.iter_builds(
+            1, "refs/heads/main", result="failed", since=make_build(2).start_time
+        )
+        assert [build["build_id"] for build in builds] == [3, 2]
+
+        assert store.get_previous_build(3) == 2
+        assert store.get_previous_build(1) is None
+
+        # The previous build is answered locally
+        pipeline.build_id = "3"
+        pipeline.store = store
+        assert pipeline.get_previous_builds() == 2
+        assert build_client.get_builds.call_count == 4
+
+
+def test_build_store_sync_without_timelines(
+    pipeline: AzurePipeline, build_client: MagicMock
+) -> None:
+    build_client.get_builds.return_value = [make_build(1)]
+    store = BuildStore()
+    assert store.sync(pipeline, 1, "refs/heads/main", with_timelines=False) == 1
+    assert store.has_build(1)
+    assert store.get_timeline(1) is None
+    build_client.get_build_timeline.assert_not_called()
+    store.close()
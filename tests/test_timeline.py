@@ -0,0 +1,86 @@
+from unittest.mock import MagicMock
+
+from azure.devops.v7_1.build.models import Timeline
+
+from azpipeline.timeline import (
+    IncrementalTimeline,
+    TimelineIndex,
+    get_failures,
+    normalize_issue_message,
+)
+from tests.conftest import make_record
+
+
+def test_timeline_index(timeline: Timeline) -> None:
+    index = TimelineIndex.from_timeline(timeline)
+    assert len(index) == len(timeline.records)
+    job = index.get("job-2")
+    assert job is not None and job.name == "Linux"
+    assert index.get("missing") is None
+    task = index.get("task-5")
+    assert task is not None
+    parent = index.parent(task)
+    assert parent is not None and parent.name == "Linux"
+    assert [r.name for r in index.children("job-2")] == ["Checkout", "Compile", "Test"]
+    assert index.children("task-4") == []
+    assert [r.name for r in index.by_type("Job")] == ["Linux", "Windows"]
+    assert [r.id for r in index.by_result("failed")] == [
+        "stage-1",
+        "job-2",
+        "task-5",
+        "task-6",
+    ]
+    assert [r.name for r in index.find("Task", "failed")] == ["Compile", "Test"]
+    assert index.find("Task", "canceled") == []
+
+
+def test_incremental_timeline(build_client: MagicMock, timeline: Timeline) -> None:
+    incremental = IncrementalTimeline(build_client, project="project", build_id=42)
+    assert incremental.timeline is None
+    first = incremental.refresh()
+    assert first is not None and first.records == timeline.records
+    assert incremental.change_id == 1
+
+    changed = make_record("task-7", "Task", "Lint", parent_id="job-3", result="failed")
+    added = make_record("task-8", "Task", "Deploy", parent_id="job-3")
+    build_client.get_build_timeline.return_value = Timeline(
+        id="timeline", change_id=3, records=[changed, added]
+    )
+    refreshed = incremental.refresh()
+    build_client.get_build_timeline.assert_called_with(
+        project="project", build_id=42, change_id=1
+    )
+    assert incremental.change_id == 3
+    assert incremental.last_changes == 2
+    assert refreshed is not None
+    assert len(refreshed.records) == 8
+    assert refreshed.records[6] is changed
+    assert refreshed.records[7] is added
+
+    build_client.get_build_timeline.return_value = None
+    assert incremental.refresh() is refreshed
+    assert incremental.last_changes == 0
+
+
+def test_get_failures(timeline: Timeline) -> None:
+    assert (
+        normalize_issue_message(
+            "Exit  code 2 at 2023-05-01T10:00:00Z (commit 3f2a9b1c)"
+        )
+        == "Exit code <n> at <time> (commit <hex>)"
+    )
+
+    timeline.records[2].result = "failed"
+    failures = get_failures(TimelineIndex.from_timeline(timeline))
+    assert [(f.stage, f.job, f.task) for f in failures.values()] == [
+        ("Build", "Linux", "Compile"),
+        ("Build", "Linux", "Test"),
+        ("Build", "Windows", None),
+    ]
+    assert list(failures.values())[0].issues == ("Compile failed",)
+
+    # Fingerprints don't depend on the volatile parts of the issue messages
+    timeline.records[4].issues[0].message = "Compile failed 2 times"
+    first = get_failures(TimelineIndex.from_timeline(timeline))
+    timeline.records[4].issues[0].message = "Compile failed 3 times"
+    assert get_failures(TimelineIndex.from_timeline(timeline)) == first
@@ -0,0 +1,49 @@
+import json
+import os
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+from azpipeline.libs.utils import JSONL_SUFFIXES, read_jsonl, write_json, write_jsonl
+
+
+def test_write_json(tmp_path: Path) -> None:
+    output_path = tmp_path / "logs" / "timeline.json"
+    write_json(output_path, {"records": []})
+    write_json(output_path, {"records": [1]})
+    assert json.loads(output_path.read_text()) == {"records": [1]}
+    assert [path.name for path in output_path.parent.iterdir()] == ["timeline.json"]
+    # Written files follow the current umask, like files created with open
+    umask = os.umask(0o027)
+    try:
+        write_json(output_path, {})
+    finally:
+        os.umask(umask)
+    assert output_path.stat().st_mode & 0o777 == 0o640
+
+
+@pytest.mark.parametrize("compression", [None, "gzip", "zstd"])
+def test_write_jsonl(tmp_path: Path, compression: str) -> None:
+    output_path = tmp_path / f"records{JSONL_SUFFIXES[compression]}"
+    records = ({"id": i, "name": f"task {i}"} for i in range(1000))
+    assert write_jsonl(output_path, records, compression) == 1000
+    assert list(read_jsonl(output_path))[999] == {"id": 999, "name": "task 999"}
+
+
+def test_write_jsonl_errors(tmp_path: Path) -> None:
+    output_path = tmp_path / "records.jsonl"
+    write_jsonl(output_path, [{"id": 1}])
+
+    def records() -> Iterator[dict]:
+        yield {"id": 2}
+        raise RuntimeError("api error")
+
+    # The previous file is kept when writing fails
+    with pytest.raises(RuntimeError):
+        write_jsonl(output_path, records())
+    assert list(read_jsonl(output_path)) == [{"id": 1}]
+    assert len(list(tmp_path.iterdir())) == 1
+
+    with pytest.raises(ValueError):
+        write_jsonl(output_path, [], compression="bz2")